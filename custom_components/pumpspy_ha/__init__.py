@@ -1,12 +1,28 @@
 """The Pumpspy-HA integration."""
 from __future__ import annotations
-from datetime import timedelta
+import asyncio
+from datetime import date, timedelta
+from functools import partial
 import logging
-from homeassistant.helpers import entity_registry
+import random
+import time
+from typing import TYPE_CHECKING
+
+import aiohttp
 
-from homeassistant.helpers.device_registry import DeviceEntry
+from homeassistant.helpers import entity_registry
 
-from .pypumpspy import InvalidAccessToken, Pumpspy
+from .pypumpspy import (
+    CAPABILITY_RHT,
+    AccountRegistry,
+    POLL_BUDGET,
+    InvalidAccessToken,
+    InvalidResponse,
+    Pumpspy,
+    SectionStatus,
+    UnsupportedDeviceType,
+    WATCH_INTERVAL,
+)
 
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import (
@@ -14,20 +30,38 @@ from homeassistant.const import (
     CONF_USERNAME,
     Platform,
 )
-from homeassistant.core import HomeAssistant
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.exceptions import ConfigEntryNotReady
+from homeassistant.helpers.event import async_call_later
 from homeassistant.helpers.update_coordinator import (
     DataUpdateCoordinator,
+    UpdateFailed,
 )
 
 
 from .const import (
     CONF_DEVICEID,
+    CONF_EXPORTER,
     CONF_MONTHLY,
+    CONF_POLL_BUDGET,
+    CONF_WATCH,
     CONF_WEEKLY,
+    DATA_ACCOUNTS,
     DOMAIN,
+    RHT_HUMIDITY,
+    RHT_TEMPERATURE,
+    SECTION_RETRY_DELAY,
+    UPDATE_INTERVAL,
+    UPDATE_JITTER,
 )
+from .history import async_setup_history
+from .rolling import RollingStats
+from .services import async_setup_services
 
 
+if TYPE_CHECKING:
+    from homeassistant.helpers.device_registry import DeviceEntry
+
 PLATFORMS: list[Platform] = [Platform.SENSOR, Platform.BINARY_SENSOR]
 
 _LOGGER = logging.getLogger(__name__)
@@ -35,25 +69,59 @@ _LOGGER = logging.getLogger(__name__)
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up Pumpspy-HA from a config entry."""
+    # entries of the same account share its login and connection pool
+    accounts: AccountRegistry = hass.data.setdefault(DATA_ACCOUNTS, AccountRegistry())
+    account = accounts.acquire(entry.data[CONF_USERNAME], entry.data[CONF_PASSWORD])
+    # also called when the setup fails
+    entry.async_on_unload(partial(accounts.release, account))
     api: Pumpspy = Pumpspy(
         username=entry.data[CONF_USERNAME],
         password=entry.data[CONF_PASSWORD],
         device_id=entry.data[CONF_DEVICEID],
+        account=account,
     )
 
     if not entry.options:
         await async_update_options(hass, entry)
 
-    await api.setup()
-    coordinator = PumpspyCoordinator(
-        hass=hass,
-        api=api,
-        weekly=entry.options.get(CONF_WEEKLY),
-        monthly=entry.options.get(CONF_MONTHLY),
-    )
-    await coordinator.async_config_entry_first_refresh()
+    try:
+        await api.setup()
+        coordinator = PumpspyCoordinator(
+            hass=hass,
+            api=api,
+            weekly=entry.options.get(CONF_WEEKLY),
+            monthly=entry.options.get(CONF_MONTHLY),
+            budget=entry.options.get(CONF_POLL_BUDGET, POLL_BUDGET),
+        )
+        await coordinator.async_config_entry_first_refresh()
+    except UnsupportedDeviceType as err:
+        _LOGGER.error(err)
+        return False
+    except (aiohttp.ClientError, asyncio.TimeoutError, InvalidResponse) as err:
+        # the retries of the lookups are used up, let Home Assistant retry later
+        raise ConfigEntryNotReady(f"Error connecting to Pumpspy: {err}") from err
 
     hass.data.setdefault(DOMAIN, {})[entry.entry_id] = coordinator
+
+    # imported here, the fleet aggregator depends on the sensor platform
+    from .fleet import async_setup_fleet
+
+    entry.async_on_unload(async_setup_fleet(hass, entry.entry_id, coordinator))
+    entry.async_on_unload(async_setup_history(hass, coordinator))
+    async_setup_services(hass)
+
+    if entry.options.get(CONF_EXPORTER):
+        from .exporter import async_setup_exporter
+
+        entry.async_on_unload(async_setup_exporter(hass, entry.entry_id, coordinator))
+
+    entry.async_on_unload(coordinator.async_cancel_retry)
+
+    if entry.options.get(CONF_WATCH):
+        entry.async_create_background_task(
+            hass, coordinator.async_watch_status(), f"{DOMAIN}_watch_{entry.entry_id}"
+        )
+
     # hass.config_entries.async_setup_platforms(entry, PLATFORMS)
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
@@ -73,6 +141,9 @@ async def async_update_options(hass: HomeAssistant, config_entry: ConfigEntry):
     options = {
         CONF_WEEKLY: config_entry.data.get(CONF_WEEKLY, False),
         CONF_MONTHLY: config_entry.data.get(CONF_MONTHLY, False),
+        CONF_EXPORTER: False,
+        CONF_WATCH: False,
+        CONF_POLL_BUDGET: POLL_BUDGET,
     }
     hass.config_entries.async_update_entry(config_entry, options=options)
 
@@ -129,7 +200,12 @@ class PumpspyCoordinator(DataUpdateCoordinator):
     """Pumpspy coordinator."""
 
     def __init__(
-        self, hass: HomeAssistant, api: Pumpspy, weekly: bool, monthly: bool
+        self,
+        hass: HomeAssistant,
+        api: Pumpspy,
+        weekly: bool,
+        monthly: bool,
+        budget: float = POLL_BUDGET,
     ) -> None:
         """Initialize my coordinator."""
         super().__init__(
@@ -138,11 +214,33 @@ class PumpspyCoordinator(DataUpdateCoordinator):
             # Name of the data. For logging purposes.
             name="Pumpspy",
             # Polling interval. Will only be polled if there are subscribers.
-            update_interval=timedelta(seconds=300),
+            update_interval=timedelta(
+                seconds=UPDATE_INTERVAL + random.uniform(0, UPDATE_JITTER)
+            ),
         )
         self.api = api
         self.weekly = weekly
         self.monthly = monthly
+        self.budget = budget
+
+        # fields that changed in the last update, None when everything should
+        # be treated as changed (first update, failed update)
+        self.changed: set[str] | None = None
+        self._last_date: date | None = None
+
+        # status of every section of the poll, failed sections keep their
+        # last good value in data and are retried on their own
+        self.sections: dict[str, SectionStatus] = {}
+        self._retry_unsub: CALLBACK_TYPE | None = None
+
+        # last hour (5 minute buckets) and last day (15 minute buckets) of
+        # temperature and humidity, fed from the status poll
+        self.rht_stats: dict[str, tuple[RollingStats, RollingStats]] = {}
+        if CAPABILITY_RHT in api.capabilities:
+            self.rht_stats = {
+                field: (RollingStats(3600, 12), RollingStats(86400, 96))
+                for field in (RHT_TEMPERATURE, RHT_HUMIDITY)
+            }
 
         self.intervals = ["day"]
         if weekly:
@@ -157,9 +255,146 @@ class PumpspyCoordinator(DataUpdateCoordinator):
         #     intervals.append("week")
         # if self.monthly:
         #     intervals.append("month")
+        self.changed = None
+        self.async_cancel_retry()
+        try:
+            new = await self.api.fetch_data(
+                intervals=self.intervals, budget=self.budget
+            )
+        except (InvalidAccessToken, InvalidResponse, aiohttp.ClientError) as err:
+            if self.data is None:
+                raise UpdateFailed(err) from err
+            # keep serving the cached data
+            _LOGGER.warning("Update failed, keeping the previous data: %s", err)
+            return self.data
+
+        self._record_sections(new)
+        data = self._merge_data(new)
+        if data is None or data["current"] is None:
+            raise UpdateFailed(f"No current data received: {new['errors']}")
+        self._sample_rht(new)
+        if data["stale"]:
+            _LOGGER.debug("Stale sections, retrying shortly: %s", new["errors"])
+            self._retry_unsub = async_call_later(
+                self.hass, SECTION_RETRY_DELAY, self._async_retry_stale
+            )
+        return data
+
+    async def _async_retry_stale(self, _now) -> None:
+        """Fetch only the sections that failed in the last update."""
+        self._retry_unsub = None
+        if self.data is None or not self.data["stale"]:
+            return
         try:
-            return await self.api.fetch_data(intervals=self.intervals)
-        except InvalidAccessToken:
-            _LOGGER.info("Access token expired, will try again")
-        except ConnectionError as err:
-            _LOGGER.error(err)
+            new = await self.api.fetch_data(
+                intervals=self.intervals, budget=self.budget, only=self.data["stale"]
+            )
+        except (InvalidAccessToken, InvalidResponse, aiohttp.ClientError) as err:
+            _LOGGER.debug("Retry of stale sections failed: %s", err)
+            return
+        self._record_sections(new)
+        self.data = self._merge_data(new)
+        self._sample_rht(new)
+        if self.changed:
+            self.async_update_listeners()
+
+    @callback
+    def async_cancel_retry(self) -> None:
+        """Cancel a pending retry of stale sections."""
+        if self._retry_unsub is not None:
+            self._retry_unsub()
+            self._retry_unsub = None
+
+    def _record_sections(self, new) -> None:
+        """Update the per-section status from a fetch_data result"""
+        now = time.time()
+        fetched = [
+            f"{motor}_{interval}" for motor in ("ac", "dc") for interval in new[motor]
+        ]
+        if new["current"] is not None:
+            fetched.append("current")
+        for section in fetched:
+            self.sections.setdefault(section, SectionStatus()).record(None, now)
+        for section, error in new["errors"].items():
+            self.sections.setdefault(section, SectionStatus()).record(error, now)
+
+    async def async_watch_status(self) -> None:
+        """Push status changes to the entities as soon as they are seen."""
+        while True:
+            try:
+                async for current in self.api.watch_current():
+                    if self.data is None:
+                        continue
+                    # keep the poll schedule, the interval data still comes from
+                    # polling
+                    new = {
+                        "current": current,
+                        "ac": {},
+                        "dc": {},
+                        "stale": self.data["stale"],
+                    }
+                    self.data = self._merge_data(new)
+                    self._sample_rht(new)
+                    if self.changed:
+                        self.async_update_listeners()
+            except Exception:  # pylint: disable=broad-except
+                # the task would end silently, leaving the entities unwatched
+                _LOGGER.exception("Status watch failed, restarting it")
+            await asyncio.sleep(WATCH_INTERVAL)
+
+    def _sample_rht(self, new) -> None:
+        """Add the temperature and humidity of a payload to the rolling stats"""
+        if not self.rht_stats or not new or not new["current"]:
+            return
+        now = time.time()
+        for field, windows in self.rht_stats.items():
+            value = new["current"][0].get(field)
+            if value is None:
+                continue
+            for window in windows:
+                window.add(now, value)
+
+    def _merge_data(self, new):
+        """
+        Merge a fresh payload into the previous one, field by field.
+        Unchanged parts keep the previous objects, and the names of the
+        changed fields are stored in self.changed: keys of the current
+        record, "<motor>_<interval>" for interval buckets and "date" when
+        the day rolled over.
+        """
+        old = self.data
+        today = date.today()
+        if old is None or new is None or not old["current"]:
+            self.changed = None
+            self._last_date = today
+            return new
+
+        changed = set()
+        if today != self._last_date:
+            changed.add("date")
+            self._last_date = today
+
+        # stale sections keep their previous values
+        merged = {"current": old["current"], "stale": new.get("stale", [])}
+        if new["current"]:
+            old_record, new_record = old["current"][0], new["current"][0]
+            for key in old_record.keys() | new_record.keys():
+                if old_record.get(key) != new_record.get(key):
+                    changed.add(key)
+            if changed - {"date"}:
+                merged["current"] = [
+                    {
+                        key: value if key in changed else old_record.get(key, value)
+                        for key, value in new_record.items()
+                    }
+                ]
+
+        for motor in ("ac", "dc"):
+            merged[motor] = dict(old[motor])
+            for interval, buckets in new[motor].items():
+                if buckets != old[motor].get(interval):
+                    merged[motor][interval] = buckets
+                    changed.add(f"{motor}_{interval}")
+
+        self.changed = changed
+        return merged
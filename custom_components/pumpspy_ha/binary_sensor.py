@@ -1,14 +1,17 @@
 """Platform for binary sensor integration."""
 from __future__ import annotations
+from dataclasses import dataclass
 from typing import Any
-from collections.abc import Mapping
+from collections.abc import Callable, Mapping
 
 from homeassistant.helpers.entity import EntityCategory
 
-from .entity import PumpspyEntity
+from .entity import PumpspyEntity, PumpspyEntityDescription
+from .pypumpspy import CAPABILITY_BACKUP, CAPABILITY_RHT, CAPABILITY_STATUS
 from homeassistant.components.binary_sensor import (
     BinarySensorDeviceClass,
     BinarySensorEntity,
+    BinarySensorEntityDescription,
 )
 from .const import (
     ALERT_AC_POWER_LOSS,
@@ -21,77 +24,113 @@ from .const import (
     ALERT_EXCESSIVE_RUN_TIME,
     ALERT_HIGH_WATER,
     ALERT_PRIMARY_PUMP_FAILURE,
-    CONF_DEVICE_NAME,
-    CONF_DEVICEID,
     DOMAIN,
+    RHT_OUTLET_STATE,
 )
 
 
+@dataclass(frozen=True, kw_only=True)
+class PumpspyBinarySensorEntityDescription(
+    BinarySensorEntityDescription, PumpspyEntityDescription
+):
+    """Describes a Pumpspy binary sensor."""
+
+    is_on_fn: Callable[[Any], bool | None]
+    attributes_fn: Callable[[Any], Mapping[str, Any] | None] | None = None
+
+
+def _alert(alert: str) -> PumpspyBinarySensorEntityDescription:
+    """Alert reported in the status record"""
+    # the battery charge level "alert" is on while the charge is fine
+    inverted = alert == ALERT_BATTERY_CHARGE_LEVEL
+
+    def _is_on(coordinator) -> bool | None:
+        val = coordinator.data["current"][0][alert]["state"]
+        return not bool(val) if inverted else val
+
+    return PumpspyBinarySensorEntityDescription(
+        key=alert,
+        name=alert.replace("_", " ").title(),
+        device_class=BinarySensorDeviceClass.CONNECTIVITY
+        if alert == ALERT_CONNECTED
+        else BinarySensorDeviceClass.PROBLEM,
+        entity_category=EntityCategory.DIAGNOSTIC,
+        fields=frozenset({alert}),
+        is_on_fn=_is_on,
+        attributes_fn=lambda coordinator: {
+            "message": coordinator.data["current"][0][alert]["message"]
+        },
+    )
+
+
+def _outlet_state(coordinator) -> bool | None:
+    """Outlet power, reported as a plain value or an alert style dict"""
+    val = coordinator.data["current"][0].get(RHT_OUTLET_STATE)
+    if isinstance(val, dict):
+        val = val.get("state")
+    return None if val is None else bool(val)
+
+
+# binary sensors of each device capability
+BINARY_SENSORS: dict[str, tuple[PumpspyBinarySensorEntityDescription, ...]] = {
+    CAPABILITY_STATUS: tuple(
+        _alert(alert)
+        for alert in (
+            ALERT_CONNECTED,
+            ALERT_HIGH_WATER,
+            ALERT_AC_POWER_LOSS,
+            ALERT_EXCESSIVE_CURRENT,
+            ALERT_EXCESSIVE_RUN_TIME,
+        )
+    ),
+    CAPABILITY_BACKUP: tuple(
+        _alert(alert)
+        for alert in (
+            ALERT_PRIMARY_PUMP_FAILURE,
+            ALERT_BATTERY_CHARGE_LEVEL,
+            ALERT_BACKUP_EXCESSIVE_CURRET,
+            ALERT_BACKUP_EXCESSIVE_RUN_TIME,
+            ALERT_BACKUP_PUMP_FAILURE,
+        )
+    ),
+    CAPABILITY_RHT: (
+        PumpspyBinarySensorEntityDescription(
+            key=RHT_OUTLET_STATE,
+            name="Outlet",
+            device_class=BinarySensorDeviceClass.POWER,
+            fields=frozenset({RHT_OUTLET_STATE}),
+            is_on_fn=_outlet_state,
+        ),
+    ),
+}
+
+
 async def async_setup_entry(hass, config_entry, async_add_entities):
     """Add sensors for passed config_entry in HA."""
     coordinator = hass.data[DOMAIN][config_entry.entry_id]
 
     new_devices = [
-        AlertBinarySensor(coordinator=coordinator, alert=ALERT_CONNECTED),
-        AlertBinarySensor(coordinator=coordinator, alert=ALERT_HIGH_WATER),
-        AlertBinarySensor(coordinator=coordinator, alert=ALERT_AC_POWER_LOSS),
-        AlertBinarySensor(coordinator=coordinator, alert=ALERT_EXCESSIVE_CURRENT),
-        AlertBinarySensor(coordinator=coordinator, alert=ALERT_EXCESSIVE_RUN_TIME),
+        PumpspyBinarySensor(coordinator=coordinator, description=description)
+        for capability, descriptions in BINARY_SENSORS.items()
+        if capability in coordinator.api.capabilities
+        for description in descriptions
     ]
 
-    if coordinator.api.has_backup() is True:
-        new_devices.extend(
-            [
-                AlertBinarySensor(
-                    coordinator=coordinator, alert=ALERT_PRIMARY_PUMP_FAILURE
-                ),
-                AlertBinarySensor(
-                    coordinator=coordinator, alert=ALERT_BATTERY_CHARGE_LEVEL
-                ),
-                AlertBinarySensor(
-                    coordinator=coordinator, alert=ALERT_BACKUP_EXCESSIVE_CURRET
-                ),
-                AlertBinarySensor(
-                    coordinator=coordinator, alert=ALERT_BACKUP_EXCESSIVE_RUN_TIME
-                ),
-                AlertBinarySensor(
-                    coordinator=coordinator, alert=ALERT_BACKUP_PUMP_FAILURE
-                ),
-            ]
-        )
     if new_devices:
         async_add_entities(new_devices)
 
 
-class AlertBinarySensor(PumpspyEntity, BinarySensorEntity):
-    """Alert Binary Sensor"""
+class PumpspyBinarySensor(PumpspyEntity, BinarySensorEntity):
+    """Pumpspy binary sensor, its state is read by its description"""
 
-    def __init__(self, coordinator, alert: str):
-        """Initialize the sensor."""
-        super().__init__(coordinator=coordinator)
-        self._available = True
-        self._alert = alert
-        self._attr_device_class = (
-            BinarySensorDeviceClass.CONNECTIVITY
-            if alert == ALERT_CONNECTED
-            else BinarySensorDeviceClass.PROBLEM
-        )
-        self._attr_entity_category = EntityCategory.DIAGNOSTIC
-
-        device_info = self.coordinator.api.get_device_info()
-
-        self._attr_unique_id = f"{device_info[CONF_DEVICEID]}_{alert}"
-        self._attr_name = (
-            f'{device_info[CONF_DEVICE_NAME]} {alert.replace("_", " ").title()}'
-        )
+    entity_description: PumpspyBinarySensorEntityDescription
 
     @property
     def is_on(self) -> bool | None:
-        val = self.coordinator.data["current"][0][self._alert]["state"]
-        if self._alert == ALERT_BATTERY_CHARGE_LEVEL:
-            val = not bool(val)
-        return val
+        return self.entity_description.is_on_fn(self.coordinator)
 
     @property
     def extra_state_attributes(self) -> Mapping[str, Any] | None:
-        return {"message": self.coordinator.data["current"][0][self._alert]["message"]}
+        if self.entity_description.attributes_fn is None:
+            return None
+        return self.entity_description.attributes_fn(self.coordinator)
@@ -1,13 +1,15 @@
 """Config flow for Pumpspy-HA integration."""
 from __future__ import annotations
 
+import asyncio
 import logging
 from typing import Any
 
+import aiohttp
 import voluptuous as vol
 
 from homeassistant.core import callback
-from .pypumpspy import Pumpspy
+from .pypumpspy import POLL_BUDGET, InvalidResponse, Pumpspy
 
 from homeassistant import config_entries
 from homeassistant.data_entry_flow import FlowResult
@@ -20,7 +22,10 @@ from homeassistant.const import (
 
 from .const import (
     CONF_DEVICEID,
+    CONF_EXPORTER,
     CONF_MONTHLY,
+    CONF_POLL_BUDGET,
+    CONF_WATCH,
     CONF_WEEKLY,
     DOMAIN,
 )
@@ -50,12 +55,17 @@ class ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             self.pumpspy = Pumpspy(
                 username=user_input[CONF_USERNAME], password=user_input[CONF_PASSWORD]
             )
-            await self.pumpspy.setup()
-            self.data[CONF_USERNAME] = user_input[CONF_USERNAME]
-            self.data[CONF_PASSWORD] = user_input[CONF_PASSWORD]
-            self.locations = await self.pumpspy.get_locations()
-            if self.locations:
-                return await self.async_step_location()
+            try:
+                await self.pumpspy.setup()
+                self.locations = await self.pumpspy.get_locations()
+            except (aiohttp.ClientError, asyncio.TimeoutError, InvalidResponse) as err:
+                _LOGGER.error("Error connecting to Pumpspy: %s", err)
+                errors["base"] = "cannot_connect"
+            else:
+                self.data[CONF_USERNAME] = user_input[CONF_USERNAME]
+                self.data[CONF_PASSWORD] = user_input[CONF_PASSWORD]
+                if self.locations:
+                    return await self.async_step_location()
 
         data_schema = vol.Schema(
             {
@@ -210,6 +220,18 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                 CONF_MONTHLY,
                 default=self.config_entry.options.get(CONF_MONTHLY, False),
             ): bool,
+            vol.Required(
+                CONF_EXPORTER,
+                default=self.config_entry.options.get(CONF_EXPORTER, False),
+            ): bool,
+            vol.Required(
+                CONF_WATCH,
+                default=self.config_entry.options.get(CONF_WATCH, False),
+            ): bool,
+            vol.Required(
+                CONF_POLL_BUDGET,
+                default=self.config_entry.options.get(CONF_POLL_BUDGET, POLL_BUDGET),
+            ): vol.All(vol.Coerce(int), vol.Range(min=10, max=290)),
         }
         return self.async_show_form(
             step_id="init",
@@ -13,6 +13,17 @@ CURRENT_URL = "/bbs/deviceid/"
 DAILY_URL = "/bbs_cycles/deviceid/<DEVICEID>/motor/ac/interval/day"
 AUTHORIZATION_HEADER = "Basic SU9TOnNlY3JldA=="
 
+# seconds between polls, each coordinator adds a random share of the jitter
+# so devices don't poll in lockstep
+UPDATE_INTERVAL = 300
+UPDATE_JITTER = 30
+# seconds before sections that failed in an update are fetched again
+SECTION_RETRY_DELAY = 30
+# cycle history cache: number of (device, motor, interval) entries kept,
+# and seconds before the open bucket of an entry is fetched again
+HISTORY_CACHE_SIZE = 64
+HISTORY_TTL = 2 * UPDATE_INTERVAL
+
 CONF_REFRESH_TOKEN = "refresh_token"
 CONF_DEVICEID = "deviceid"
 CONF_DEVICE_NAME = "device_name"
@@ -24,6 +35,24 @@ CONF_BACKUP_PUMP = "backup"
 CONF_DAILY = "daily"
 CONF_MONTHLY = "monthly"
 CONF_WEEKLY = "weekly"
+CONF_EXPORTER = "metrics_exporter"
+CONF_WATCH = "status_watch"
+CONF_POLL_BUDGET = "poll_budget"
+
+DATA_EXPORTER = f"{DOMAIN}_exporter"
+DATA_FLEET = f"{DOMAIN}_fleet"
+DATA_HISTORY = f"{DOMAIN}_history"
+DATA_ACCOUNTS = f"{DOMAIN}_accounts"
+
+# sent when the entry owning the fleet sensors unloads
+SIGNAL_FLEET_ORPHANED = f"{DOMAIN}_fleet_orphaned"
+
+SERVICE_GET_CYCLE_HISTORY = "get_cycle_history"
+ATTR_DEVICE_ID = "device_id"
+ATTR_PUMP = "pump"
+ATTR_INTERVAL = "interval"
+ATTR_START = "start"
+ATTR_END = "end"
 
 ALERT_CONNECTED = "connected"
 ALERT_HIGH_WATER = "high_water_alert"
@@ -35,3 +64,15 @@ ALERT_BACKUP_EXCESSIVE_RUN_TIME = "backup_excessive_run_time"
 ALERT_BACKUP_EXCESSIVE_CURRET = "backup_excessive_current"
 ALERT_PRIMARY_PUMP_FAILURE = "primary_pump_failure"
 ALERT_BACKUP_PUMP_FAILURE = "backup_pump_failure"
+
+# status fields of rht outlets
+# the status payload carries no unit, the temperature is assumed to be in °F
+# like the Pumpspy app shows it (HA converts it to the configured unit)
+RHT_TEMPERATURE = "temperature"
+RHT_HUMIDITY = "humidity"
+RHT_OUTLET_STATE = "outlet_state"
+
+STAT_LATENCY = "api_latency"
+STAT_REQUESTS = "api_requests"
+STAT_ERRORS = "api_errors"
+STAT_RETRIES = "api_retries"
@@ -0,0 +1,32 @@
+"""Diagnostics support for Pumpspy-HA."""
+from __future__ import annotations
+
+from dataclasses import asdict
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+
+TO_REDACT = {CONF_PASSWORD, CONF_USERNAME}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+
+    return {
+        "entry": async_redact_data(entry.as_dict(), TO_REDACT),
+        "device": coordinator.api.get_device_info(),
+        "stats": coordinator.api.stats.as_dict(),
+        "sections": {
+            section: asdict(status) for section, status in coordinator.sections.items()
+        },
+        "trace": coordinator.api.trace.as_list(),
+        "data": coordinator.data,
+    }
@@ -1,30 +1,63 @@
 """Base Entity for Pumpspy."""
 from __future__ import annotations
 
-from homeassistant.helpers.entity import DeviceInfo
+from dataclasses import dataclass
+
+from homeassistant.core import callback
+from homeassistant.helpers.entity import DeviceInfo, EntityDescription
 from . import PumpspyCoordinator
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 from .const import DOMAIN, MANUFACTURER
 
 
+@dataclass(frozen=True, kw_only=True)
+class PumpspyEntityDescription(EntityDescription):
+    """Describes a Pumpspy entity."""
+
+    # coordinator fields the state depends on, None to update on every refresh
+    fields: frozenset[str] | None = None
+
+
 class PumpspyEntity(CoordinatorEntity[PumpspyCoordinator]):
     """Defines a base Pumpspy entity."""
 
-    def __init__(self, coordinator: PumpspyCoordinator) -> None:
+    entity_description: PumpspyEntityDescription
+
+    def __init__(
+        self, coordinator: PumpspyCoordinator, description: PumpspyEntityDescription
+    ) -> None:
         """Initialize the entity."""
-        self.coordinator = coordinator
         super().__init__(coordinator)
+        self.entity_description = description
+        api = coordinator.api
+        self._attr_unique_id = f"{api.device_id}_{description.key}"
+        self._attr_name = f"{api.device_name} {description.name}"
+
+    @property
+    def available(self) -> bool:
+        """Stay available as long as there is (possibly cached) data."""
+        return self.coordinator.data is not None
 
     @property
     def device_info(self) -> DeviceInfo | None:
-        try:
-            return DeviceInfo(
-                identifiers={(DOMAIN, self.coordinator.data["current"][0]["deviceid"])},
-                name=self.coordinator.data["current"][0]["user_nickname"],
-                manufacturer=MANUFACTURER,
-                model=self.coordinator.data["current"][0]["device_types_name"],
-                hw_version=self.coordinator.data["current"][0]["hardware_rev"],
-                sw_version=self.coordinator.data["current"][0]["firmware_rev"],
-            )
-        except TypeError:
-            return None
+        device_info = self.coordinator.api.get_device_info()
+        current = {}
+        if self.coordinator.data is not None and self.coordinator.data["current"]:
+            current = self.coordinator.data["current"][0]
+        return DeviceInfo(
+            identifiers={(DOMAIN, current.get("deviceid", device_info["deviceid"]))},
+            name=current.get("user_nickname", device_info["device_name"]),
+            manufacturer=MANUFACTURER,
+            model=current.get("device_types_name", device_info["device_name"]),
+            hw_version=current.get("hardware_rev"),
+            sw_version=current.get("firmware_rev"),
+        )
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Only write the state when a field this entity reads has changed."""
+        changed = self.coordinator.changed
+        fields = self.entity_description.fields
+        if changed is not None and fields is not None and changed.isdisjoint(fields):
+            return
+        super()._handle_coordinator_update()
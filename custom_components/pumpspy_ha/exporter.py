@@ -0,0 +1,194 @@
+"""Prometheus/OpenMetrics exporter for Pumpspy-HA."""
+from __future__ import annotations
+
+from aiohttp import web
+
+from homeassistant.components.http import HomeAssistantView
+from homeassistant.core import HomeAssistant, callback
+
+from .const import (
+    ALERT_BATTERY_CHARGE_LEVEL,
+    CONF_GALLONS,
+    DATA_EXPORTER,
+)
+from .pypumpspy import LATENCY_BUCKETS
+from .sensor import current_bucket_value
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# family name: (type, help)
+METRIC_FAMILIES = {
+    "pumpspy_rssi_dbm": ("gauge", "Last reported signal strength"),
+    "pumpspy_battery_percent": ("gauge", "Backup battery charge"),
+    "pumpspy_cycles": ("gauge", "Pump cycles in the current interval"),
+    "pumpspy_gallons": ("gauge", "Gallons pumped in the current interval"),
+    "pumpspy_alert": ("gauge", "Alert state, 1 when active"),
+    "pumpspy_api_request_duration_seconds": (
+        "histogram",
+        "Latency of Pumpspy API requests",
+    ),
+    "pumpspy_api_requests": ("counter", "Pumpspy API requests"),
+    "pumpspy_api_errors": ("counter", "Failed Pumpspy API requests"),
+    "pumpspy_api_retries": ("counter", "Retried Pumpspy API requests"),
+    "pumpspy_api_token_refreshes": ("counter", "Access token refreshes"),
+}
+
+
+def _escape(value) -> str:
+    """Escape a label value"""
+    return (
+        str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    )
+
+
+def _labels(**labels) -> str:
+    """Render a label set"""
+    return ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+def render_device(coordinator) -> dict[str, list[str]]:
+    """Render the samples of one coordinator, grouped by metric family"""
+    api = coordinator.api
+    device = _labels(deviceid=api.device_id, device=api.device_name)
+    samples: dict[str, list[str]] = {family: [] for family in METRIC_FAMILIES}
+
+    data = coordinator.data
+    current = data["current"][0] if data and data.get("current") else None
+    if current is not None:
+        if current.get("last_rssi") is not None:
+            samples["pumpspy_rssi_dbm"].append(
+                f"pumpspy_rssi_dbm{{{device}}} {current['last_rssi']}"
+            )
+        if api.has_backup() and current.get("battery_charge_percentage") is not None:
+            samples["pumpspy_battery_percent"].append(
+                f"pumpspy_battery_percent{{{device}}} "
+                f"{current['battery_charge_percentage']}"
+            )
+        for alert, value in current.items():
+            if not isinstance(value, dict) or "state" not in value:
+                continue
+            state = bool(value["state"])
+            if alert == ALERT_BATTERY_CHARGE_LEVEL:
+                state = not state
+            samples["pumpspy_alert"].append(
+                f"pumpspy_alert{{{device},{_labels(alert=alert)}}} {int(state)}"
+            )
+
+    if data:
+        for motor in ("ac", "dc"):
+            for interval, buckets in data.get(motor, {}).items():
+                labels = f"{device},{_labels(motor=motor, interval=interval)}"
+                cycles = current_bucket_value(buckets, interval, "total_count")
+                gallons = current_bucket_value(buckets, interval, CONF_GALLONS)
+                samples["pumpspy_cycles"].append(f"pumpspy_cycles{{{labels}}} {cycles}")
+                samples["pumpspy_gallons"].append(
+                    f"pumpspy_gallons{{{labels}}} {gallons}"
+                )
+
+    for endpoint, stats in api.stats.endpoints.items():
+        labels = f"{device},{_labels(endpoint=endpoint)}"
+        histogram = samples["pumpspy_api_request_duration_seconds"]
+        cumulative = 0
+        for bound, count in zip([*LATENCY_BUCKETS, "+Inf"], stats.buckets):
+            cumulative += count
+            histogram.append(
+                "pumpspy_api_request_duration_seconds_bucket"
+                f'{{{labels},le="{bound}"}} {cumulative}'
+            )
+        histogram.append(
+            "pumpspy_api_request_duration_seconds_sum"
+            f"{{{labels}}} {stats.latency_sum}"
+        )
+        histogram.append(
+            "pumpspy_api_request_duration_seconds_count"
+            f"{{{labels}}} {stats.requests}"
+        )
+        samples["pumpspy_api_requests"].append(
+            f"pumpspy_api_requests_total{{{labels}}} {stats.requests}"
+        )
+        samples["pumpspy_api_errors"].append(
+            f"pumpspy_api_errors_total{{{labels}}} {stats.errors}"
+        )
+        samples["pumpspy_api_retries"].append(
+            f"pumpspy_api_retries_total{{{labels}}} {stats.retries}"
+        )
+    samples["pumpspy_api_token_refreshes"].append(
+        f"pumpspy_api_token_refreshes_total{{{device}}} "
+        f"{api.stats.token_refreshes}"
+    )
+    return samples
+
+
+class PumpspyExporter:
+    """Cache of rendered metrics, refreshed once per coordinator poll"""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self._devices: dict[str, dict[str, list[str]]] = {}
+        self._document: str | None = None
+
+    @callback
+    def async_update(self, entry_id: str, coordinator) -> None:
+        """Re-render the samples of one device"""
+        self._devices[entry_id] = render_device(coordinator)
+        self._document = None
+
+    @callback
+    def async_remove(self, entry_id: str) -> None:
+        """Drop a device from the export"""
+        self._devices.pop(entry_id, None)
+        self._document = None
+
+    def render(self) -> str:
+        """Full OpenMetrics document, rebuilt only after an update"""
+        if self._document is None:
+            lines = []
+            for family, (metric_type, metric_help) in METRIC_FAMILIES.items():
+                lines.append(f"# TYPE {family} {metric_type}")
+                lines.append(f"# HELP {family} {metric_help}")
+                for samples in self._devices.values():
+                    lines.extend(samples[family])
+            lines.append("# EOF\n")
+            self._document = "\n".join(lines)
+        return self._document
+
+
+class PumpspyMetricsView(HomeAssistantView):
+    """Serve the cached metrics"""
+
+    url = "/api/pumpspy_ha/metrics"
+    name = "api:pumpspy_ha:metrics"
+
+    def __init__(self, exporter: PumpspyExporter) -> None:
+        """Initialize."""
+        self.exporter = exporter
+
+    async def get(self, request: web.Request) -> web.Response:
+        """Return the metrics document"""
+        return web.Response(
+            body=self.exporter.render().encode(),
+            headers={"Content-Type": CONTENT_TYPE},
+        )
+
+
+@callback
+def async_setup_exporter(hass: HomeAssistant, entry_id: str, coordinator):
+    """Add a coordinator to the exporter, registering the view on first use"""
+    exporter: PumpspyExporter | None = hass.data.get(DATA_EXPORTER)
+    if exporter is None:
+        exporter = hass.data[DATA_EXPORTER] = PumpspyExporter()
+        hass.http.register_view(PumpspyMetricsView(exporter))
+
+    @callback
+    def _async_update() -> None:
+        exporter.async_update(entry_id, coordinator)
+
+    _async_update()
+    remove_listener = coordinator.async_add_listener(_async_update)
+
+    @callback
+    def _async_remove() -> None:
+        remove_listener()
+        exporter.async_remove(entry_id)
+
+    return _async_remove
@@ -0,0 +1,331 @@
+"""Fleet wide aggregation over every configured Pumpspy device."""
+from __future__ import annotations
+
+from array import array
+from collections.abc import Callable
+import heapq
+import math
+import time
+
+import voluptuous as vol
+
+from homeassistant.components import websocket_api
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.event import async_call_later
+
+from .const import (
+    ALERT_BATTERY_CHARGE_LEVEL,
+    ALERT_CONNECTED,
+    CONF_CYCLES,
+    CONF_GALLONS,
+    DATA_FLEET,
+    DOMAIN,
+    SIGNAL_FLEET_ORPHANED,
+)
+from .sensor import current_bucket_value
+
+FLEET_INTERVALS = ("day", "week", "month")
+FLEET_METRICS = {CONF_CYCLES: "total_count", CONF_GALLONS: CONF_GALLONS}
+FLEET_TOP_N = 5
+# seconds to wait after a device refreshed before recomputing, so the
+# refreshes of a poll cycle are aggregated together
+FLEET_RECOMPUTE_DELAY = 10
+
+# summary field each fleet summary sort key orders by
+FLEET_SORT_KEYS = {
+    "name": "name",
+    "alerts": "alert_count",
+    "battery": "battery",
+    "last_cycle_age": "last_cycle",
+    "gallons_today": "gallons_today",
+}
+
+
+def device_metric(data, metric: str, interval: str) -> float:
+    """Main plus backup total for the current interval, NaN if not polled"""
+    if not data:
+        return math.nan
+    key = FLEET_METRICS[metric]
+    value = math.nan
+    for motor in ("ac", "dc"):
+        buckets = data.get(motor, {}).get(interval)
+        if buckets is None:
+            continue
+        value = (0 if math.isnan(value) else value) + current_bucket_value(
+            buckets, interval, key
+        )
+    return value
+
+
+def device_summary(coordinator) -> dict:
+    """Health summary of one device, as shown by the fleet summary command"""
+    api = coordinator.api
+    data = coordinator.data
+    current = data["current"][0] if data and data.get("current") else {}
+
+    alerts = []
+    for alert, value in current.items():
+        if alert == ALERT_CONNECTED:
+            continue
+        if not isinstance(value, dict) or "state" not in value:
+            continue
+        state = bool(value["state"])
+        if alert == ALERT_BATTERY_CHARGE_LEVEL:
+            state = not state
+        if state:
+            alerts.append(alert)
+
+    connected = current.get(ALERT_CONNECTED)
+    last_cycle = current.get("lastcycletime")
+    gallons = device_metric(data, CONF_GALLONS, "day")
+    return {
+        "deviceid": api.device_id,
+        "name": current.get("user_nickname") or api.device_name or str(api.device_id),
+        "connected": None if connected is None else bool(connected.get("state")),
+        "alerts": alerts,
+        "alert_count": len(alerts),
+        "battery": current.get("battery_charge_percentage")
+        if api.has_backup()
+        else None,
+        "last_cycle": None if last_cycle is None else last_cycle / 1000,
+        "gallons_today": None if math.isnan(gallons) else gallons,
+        "stale": bool(data and data.get("stale")),
+    }
+
+
+class FleetAggregator:
+    """
+    Keeps one column (array of doubles, one slot per device) for every
+    metric/interval pair and recomputes the fleet aggregates in a single
+    pass over the columns, shortly after a burst of device refreshes.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        """Initialize."""
+        self.hass = hass
+        self._recompute_unsub: CALLBACK_TYPE | None = None
+        self._slots: dict[str, int] = {}
+        self.names: list[str] = []
+        self.columns: dict[tuple[str, str], array] = {
+            (metric, interval): array("d")
+            for metric in FLEET_METRICS
+            for interval in FLEET_INTERVALS
+        }
+        self.aggregates: dict[tuple[str, str], dict] = {}
+        # health summary of every device, by config entry
+        self.devices: dict[str, dict] = {}
+        self.owner: str | None = None
+        self._listeners: list[Callable[[], None]] = []
+
+    @callback
+    def async_update(self, entry_id: str, coordinator) -> None:
+        """Store the latest values of one device, recomputing if they changed"""
+        self.devices[entry_id] = device_summary(coordinator)
+        slot = self._slots.get(entry_id)
+        changed = slot is None
+        if slot is None:
+            slot = self._slots[entry_id] = len(self.names)
+            self.names.append("")
+            for column in self.columns.values():
+                column.append(math.nan)
+
+        data = coordinator.data
+        current = data["current"][0] if data and data.get("current") else {}
+        name = current.get("user_nickname") or str(coordinator.api.device_id)
+        if name != self.names[slot]:
+            self.names[slot] = name
+            changed = True
+        for (metric, interval), column in self.columns.items():
+            value = device_metric(data, metric, interval)
+            # NaN never equals itself
+            if value != column[slot] and not (
+                math.isnan(value) and math.isnan(column[slot])
+            ):
+                column[slot] = value
+                changed = True
+        if changed:
+            self._async_schedule_recompute()
+
+    @callback
+    def async_remove(self, entry_id: str) -> None:
+        """Drop a device, moving the last slot into its place"""
+        self.devices.pop(entry_id, None)
+        slot = self._slots.pop(entry_id, None)
+        if slot is None:
+            return
+        last = len(self.names) - 1
+        if slot != last:
+            moved = next(key for key, value in self._slots.items() if value == last)
+            self._slots[moved] = slot
+            self.names[slot] = self.names[last]
+            for column in self.columns.values():
+                column[slot] = column[last]
+        self.names.pop()
+        for column in self.columns.values():
+            column.pop()
+        self._async_schedule_recompute()
+
+    @callback
+    def _async_schedule_recompute(self) -> None:
+        """Recompute once the current burst of refreshes is over"""
+        if not self.aggregates:
+            # first device, no reason to leave the fleet sensors empty
+            self._async_recompute()
+        elif self._recompute_unsub is None:
+            self._recompute_unsub = async_call_later(
+                self.hass, FLEET_RECOMPUTE_DELAY, self._async_recompute
+            )
+
+    @callback
+    def async_cancel_recompute(self) -> None:
+        """Cancel a pending recompute"""
+        if self._recompute_unsub is not None:
+            self._recompute_unsub()
+            self._recompute_unsub = None
+
+    @callback
+    def _async_recompute(self, _now=None) -> None:
+        """
+        One pass over every column, the listeners are only called when an
+        aggregate changed
+        """
+        self._recompute_unsub = None
+        aggregates = {}
+        for key, column in self.columns.items():
+            values = [
+                (value, slot)
+                for slot, value in enumerate(column)
+                if not math.isnan(value)
+            ]
+            if not values:
+                aggregates[key] = {"sum": None, "max": None, "top": []}
+                continue
+            top = heapq.nlargest(FLEET_TOP_N, values)
+            aggregates[key] = {
+                "sum": sum(value for value, _ in values),
+                "max": top[0][0],
+                "top": [
+                    {"name": self.names[slot], "value": value} for value, slot in top
+                ],
+            }
+        if aggregates == self.aggregates:
+            return
+        self.aggregates = aggregates
+        for update_callback in list(self._listeners):
+            update_callback()
+
+    def summary(
+        self,
+        sort_by: str = "name",
+        descending: bool = False,
+        alerting: bool | None = None,
+        connected: bool | None = None,
+        limit: int | None = None,
+    ) -> list[dict]:
+        """
+        Device summaries, optionally filtered on having active alerts and on
+        connectivity, sorted on one of FLEET_SORT_KEYS (unknown values last).
+        """
+        now = time.time()
+        field = FLEET_SORT_KEYS[sort_by]
+        # the age of the last cycle grows as its time does not
+        reverse = descending != (sort_by == "last_cycle_age")
+        rows = [
+            row
+            for row in self.devices.values()
+            if (alerting is None or bool(row["alerts"]) == alerting)
+            and (connected is None or row["connected"] == connected)
+        ]
+        known = [row for row in rows if row[field] is not None]
+        known.sort(key=lambda row: row[field], reverse=reverse)
+        rows = known + [row for row in rows if row[field] is None]
+        if limit is not None:
+            rows = rows[:limit]
+        return [
+            {
+                **row,
+                "last_cycle_age": None
+                if row["last_cycle"] is None
+                else round(now - row["last_cycle"]),
+            }
+            for row in rows
+        ]
+
+    @callback
+    def async_add_listener(self, update_callback: Callable[[], None]):
+        """Call update_callback after every recompute, returns the remover"""
+        self._listeners.append(update_callback)
+
+        @callback
+        def _remove() -> None:
+            self._listeners.remove(update_callback)
+
+        return _remove
+
+
+@callback
+def async_get_fleet(hass: HomeAssistant) -> FleetAggregator:
+    """Get (or create) the fleet aggregator"""
+    fleet: FleetAggregator | None = hass.data.get(DATA_FLEET)
+    if fleet is None:
+        fleet = hass.data[DATA_FLEET] = FleetAggregator(hass)
+        websocket_api.async_register_command(hass, websocket_fleet_summary)
+    return fleet
+
+
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): f"{DOMAIN}/fleet_summary",
+        vol.Optional("sort_by", default="name"): vol.In(FLEET_SORT_KEYS),
+        vol.Optional("descending", default=False): bool,
+        vol.Optional("alerting"): bool,
+        vol.Optional("connected"): bool,
+        vol.Optional("limit"): vol.All(int, vol.Range(min=1)),
+    }
+)
+@callback
+def websocket_fleet_summary(
+    hass: HomeAssistant, connection: websocket_api.ActiveConnection, msg: dict
+) -> None:
+    """Return the precomputed health summary of every device"""
+    fleet = async_get_fleet(hass)
+    connection.send_result(
+        msg["id"],
+        {
+            "devices": fleet.summary(
+                sort_by=msg["sort_by"],
+                descending=msg["descending"],
+                alerting=msg.get("alerting"),
+                connected=msg.get("connected"),
+                limit=msg.get("limit"),
+            )
+        },
+    )
+
+
+@callback
+def async_setup_fleet(hass: HomeAssistant, entry_id: str, coordinator):
+    """Feed a coordinator into the fleet aggregator"""
+    fleet = async_get_fleet(hass)
+
+    @callback
+    def _async_update() -> None:
+        fleet.async_update(entry_id, coordinator)
+
+    _async_update()
+    remove_listener = coordinator.async_add_listener(_async_update)
+
+    @callback
+    def _async_remove() -> None:
+        remove_listener()
+        fleet.async_remove(entry_id)
+        if fleet.owner == entry_id:
+            fleet.owner = None
+            # another entry takes the fleet sensors over
+            async_dispatcher_send(hass, SIGNAL_FLEET_ORPHANED)
+        if not fleet.devices:
+            fleet.async_cancel_recompute()
+            fleet.aggregates = {}
+
+    return _async_remove
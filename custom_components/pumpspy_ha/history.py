@@ -0,0 +1,196 @@
+"""Cache of the cycle history of every configured Pumpspy device."""
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from datetime import date
+import time
+
+from homeassistant.core import HomeAssistant, callback
+
+from .const import DATA_HISTORY, HISTORY_CACHE_SIZE, HISTORY_TTL
+from .pypumpspy import InvalidAccessToken
+
+
+def bucket_start(bucket: dict, interval: str) -> date:
+    """First day of the day/week/month an interval bucket covers"""
+    if interval == "week":
+        return date.fromisocalendar(bucket["year_num"], bucket["week_num"], 1)
+    if interval == "month":
+        return date(bucket["year_num"], bucket["month_num"], 1)
+    return date(bucket["year_num"], bucket["month_num"], bucket["day_num"])
+
+
+def period_start(day: date, interval: str) -> date:
+    """First day of the day/week/month day falls in"""
+    if interval == "week":
+        return date.fromordinal(day.toordinal() - day.weekday())
+    if interval == "month":
+        return day.replace(day=1)
+    return day
+
+
+class HistoryEntry:
+    """
+    Buckets of one device, motor and interval. Closed buckets never change
+    and are kept for good, the open (current) bucket expires after the ttl.
+    """
+
+    __slots__ = ("closed", "open", "fetched")
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self.closed: dict[date, dict] = {}
+        self.open: tuple[date, dict] | None = None
+        self.fetched: float | None = None
+
+    def update(self, buckets: list[dict], interval: str, now: float) -> None:
+        """Merge a fresh interval response"""
+        current = period_start(date.today(), interval)
+        self.open = None
+        for bucket in buckets:
+            try:
+                start = bucket_start(bucket, interval)
+            except (KeyError, TypeError, ValueError):
+                continue
+            if start < current:
+                self.closed[start] = bucket
+            elif start == current:
+                self.open = (start, bucket)
+        self.fetched = now
+
+    def fresh(self, interval: str, now: float) -> bool:
+        """The open bucket is still current and within the ttl"""
+        if self.fetched is None or now - self.fetched > HISTORY_TTL:
+            return False
+        return self.open is None or self.open[0] == period_start(date.today(), interval)
+
+    def buckets(self, start: date | None, end: date | None) -> list[tuple[date, dict]]:
+        """Buckets between start and end (inclusive), oldest first"""
+        buckets = sorted(self.closed.items(), key=lambda item: item[0])
+        if self.open is not None:
+            buckets.append(self.open)
+        return [
+            (day, bucket)
+            for day, bucket in buckets
+            if (start is None or day >= start) and (end is None or day <= end)
+        ]
+
+
+class CycleHistoryCache:
+    """
+    LRU cache of interval buckets keyed by (deviceid, motor, interval).
+    Fed by every coordinator poll, and by the endpoint itself when a query
+    asks for an interval that isn't polled or whose open bucket expired.
+    """
+
+    def __init__(self, size: int = HISTORY_CACHE_SIZE) -> None:
+        """Initialize."""
+        self.size = size
+        self._entries: OrderedDict[tuple, HistoryEntry] = OrderedDict()
+        self._pending: dict[tuple, asyncio.Future] = {}
+
+    def _entry(self, key: tuple) -> HistoryEntry:
+        """Get (or create) an entry, marking it most recently used"""
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = HistoryEntry()
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+        return entry
+
+    @callback
+    def async_update(self, coordinator) -> None:
+        """Store the interval buckets of a coordinator poll"""
+        data = coordinator.data
+        if not data:
+            return
+        changed = coordinator.changed
+        for motor in ("ac", "dc"):
+            for interval, buckets in data.get(motor, {}).items():
+                section = f"{motor}_{interval}"
+                status = coordinator.sections.get(section)
+                if buckets is None or status is None or status.last_success is None:
+                    continue
+                key = (str(coordinator.api.device_id), motor, interval)
+                entry = self._entry(key)
+                if entry.fetched == status.last_success:
+                    continue  # nothing fetched since, e.g. a status watch update
+                if (
+                    entry.fetched is None
+                    or changed is None
+                    or section in changed
+                    or "date" in changed
+                ):
+                    entry.update(buckets, interval, status.last_success)
+                else:
+                    # same buckets as before, only the open one got fresher
+                    entry.fetched = status.last_success
+
+    async def async_get(
+        self,
+        coordinator,
+        motor: str,
+        interval: str,
+        start: date | None = None,
+        end: date | None = None,
+    ) -> list[tuple[date, dict]]:
+        """Buckets of a device, only querying the API when the cache is stale"""
+        key = (str(coordinator.api.device_id), motor, interval)
+        entry = self._entry(key)
+        if not entry.fresh(interval, time.time()):
+            # concurrent queries for the same key share one request
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = asyncio.ensure_future(
+                    self._async_fetch(coordinator.api, motor, interval)
+                )
+                pending.add_done_callback(lambda _: self._pending.pop(key, None))
+            buckets = await asyncio.shield(pending)
+            entry = self._entry(key)
+            entry.update(buckets, interval, time.time())
+        return entry.buckets(start, end)
+
+    async def _async_fetch(self, api, motor: str, interval: str) -> list[dict]:
+        """
+        Stream an interval endpoint, at history priority so the polls go
+        first, refreshing the token once if needed
+        """
+        for attempt in range(2):
+            token = api.access_token
+            async with api.session(headers=api.authed_headers()) as session:
+                try:
+                    return [
+                        bucket
+                        async for bucket in api.iter_interval_data(
+                            session=session, motor=motor, interval=interval
+                        )
+                    ]
+                except InvalidAccessToken:
+                    if attempt:
+                        raise
+            await api.refresh_token(token)
+
+
+@callback
+def async_get_history(hass: HomeAssistant) -> CycleHistoryCache:
+    """Get (or create) the history cache"""
+    history: CycleHistoryCache | None = hass.data.get(DATA_HISTORY)
+    if history is None:
+        history = hass.data[DATA_HISTORY] = CycleHistoryCache()
+    return history
+
+
+@callback
+def async_setup_history(hass: HomeAssistant, coordinator):
+    """Feed the polls of a coordinator into the history cache"""
+    history = async_get_history(hass)
+
+    @callback
+    def _async_update() -> None:
+        history.async_update(coordinator)
+
+    _async_update()
+    return coordinator.async_add_listener(_async_update)
@@ -1,9 +1,27 @@
 """Python package to talk to Pumpspy API"""
 
 import asyncio
+import codecs
+import heapq
+import itertools
+import json
 import logging
+import os
+import random
+import sys
+import time
 import aiohttp
-from datetime import date
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass
+from yarl import URL
+
+try:
+    import orjson
+
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
 AUTH_USERNAME = "IOS"
 AUTH_PASSWORD = "secret"
@@ -18,63 +36,679 @@ CURRENT_URL = "/bbs/deviceid/"
 DEVICEINFO_URL = "devices/deviceid"
 DAILY_URL = "/bbs_cycles/deviceid/<DEVICEID>/motor/ac/interval/day"
 
+# upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# responses larger than this are refused instead of decoded
+MAX_PAYLOAD_SIZE = 4 * 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+
+# request budgets (requests per second, burst size)
+HOST_RATE = 5.0
+HOST_BURST = 10
+ACCOUNT_RATE = 2.0
+ACCOUNT_BURST = 5
+
+# connections an account keeps open to the server, shared by its clients
+ACCOUNT_CONNECTIONS = 4
+
+# attempts of the account and device lookups, and their backoff (seconds,
+# doubled after every attempt)
+RETRY_ATTEMPTS = 5
+RETRY_BACKOFF = 1.0
+RETRY_BACKOFF_MAX = 30.0
+RETRY_ERRORS = (
+    aiohttp.ServerDisconnectedError,
+    aiohttp.ClientResponseError,
+    aiohttp.ClientConnectorError,
+    asyncio.TimeoutError,
+)
+
+# status watch: seconds between polls when the server has no event stream,
+# and how long an event stream may stay silent before reconnecting
+WATCH_INTERVAL = 30
+WATCH_IDLE_TIMEOUT = 300
+
+# seconds a fetch_data call may take, and the share of it a single
+# connection attempt may use
+POLL_BUDGET = 60
+CONNECT_BUDGET_SHARE = 0.25
+
+# rate limiter priorities, lower goes first
+PRIORITY_CURRENT = 0
+PRIORITY_INTERVAL = 1
+PRIORITY_HISTORY = 2
+
+# request trace: number of summaries kept, share of successful requests
+# recorded (failed ones always are) and length of the kept body excerpts
+TRACE_SIZE = 100
+TRACE_SAMPLE_RATE = 0.1
+TRACE_EXCERPT_SIZE = 200
+REDACTED = "**REDACTED**"
+# shorter secrets are not redacted, they would mangle every url and body
+TRACE_MIN_SECRET_SIZE = 4
+
 LOG = logging.getLogger(__name__)
 
-device_types = {
-    2: {
-        "endpoint": "pump_outlets",
-        "interval_endpoint": "pump_outlet",
-        "has_backup": False,
-    },
-    3: {"endpoint": "bbs", "interval_endpoint": "bbs", "has_backup": True},
-    4: {
-        "endpoint": "rht_outlets",
-        "interval_endpoint": "rht_outlet",
-        "has_backup": False,
-    },
-    5: {
-        "endpoint": "rht_outlets",
-        "interval_endpoint": "rht_outlet",
-        "has_backup": False,
-    },
-    6: {
-        "endpoint": "rht_outlets",
-        "interval_endpoint": "rht_outlet",
-        "has_backup": False,
-    },
+# device capabilities
+CAPABILITY_STATUS = "status"  # signal strength, connectivity and pump alerts
+CAPABILITY_CYCLES = "cycles"  # main pump last cycle and interval totals
+CAPABILITY_BACKUP = "backup"  # backup pump, battery and backup alerts
+CAPABILITY_RHT = "rht"  # temperature, humidity and outlet state
+
+
+@dataclass(frozen=True)
+class DeviceType:
+    """Endpoints and capabilities of a device type"""
+
+    endpoint: str
+    interval_endpoint: str
+    capabilities: frozenset[str]
+
+    @property
+    def motors(self) -> tuple[str, ...]:
+        """Motors with interval data, "ac" for main, "dc" for backup"""
+        if CAPABILITY_CYCLES not in self.capabilities:
+            return ()
+        if CAPABILITY_BACKUP in self.capabilities:
+            return ("ac", "dc")
+        return ("ac",)
+
+
+PUMP_OUTLET = DeviceType(
+    endpoint="pump_outlets",
+    interval_endpoint="pump_outlet",
+    capabilities=frozenset({CAPABILITY_STATUS, CAPABILITY_CYCLES}),
+)
+BATTERY_BACKUP_SYSTEM = DeviceType(
+    endpoint="bbs",
+    interval_endpoint="bbs",
+    capabilities=frozenset({CAPABILITY_STATUS, CAPABILITY_CYCLES, CAPABILITY_BACKUP}),
+)
+RHT_OUTLET = DeviceType(
+    endpoint="rht_outlets",
+    interval_endpoint="rht_outlet",
+    capabilities=frozenset({CAPABILITY_STATUS, CAPABILITY_CYCLES, CAPABILITY_RHT}),
+)
+
+# iddevice_types reported by the api
+DEVICE_TYPES: dict[int, DeviceType] = {
+    2: PUMP_OUTLET,
+    3: BATTERY_BACKUP_SYSTEM,
+    4: RHT_OUTLET,
+    5: RHT_OUTLET,
+    6: RHT_OUTLET,
 }
 
 
-class Pumpspy:
-    """Python class to talk to Pumpspy API"""
+class EndpointStats:
+    """Counters and latency histogram for a single endpoint"""
+
+    __slots__ = (
+        "requests",
+        "errors",
+        "retries",
+        "bytes_received",
+        "latency_sum",
+        "latency_max",
+        "last_latency",
+        "buckets",
+    )
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes_received = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.last_latency = None
+        # one slot per LATENCY_BUCKETS entry plus the overflow (+Inf) slot
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, latency: float, size: int, error: bool) -> None:
+        """Record a finished request"""
+        self.requests += 1
+        if error:
+            self.errors += 1
+        self.bytes_received += size
+        self.latency_sum += latency
+        self.last_latency = latency
+        if latency > self.latency_max:
+            self.latency_max = latency
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                self.buckets[index] += 1
+                return
+        self.buckets[-1] += 1
+
+    @property
+    def latency_avg(self):
+        """Mean latency in seconds, None before the first request"""
+        if self.requests == 0:
+            return None
+        return self.latency_sum / self.requests
+
+    def as_dict(self) -> dict:
+        """Plain dict representation"""
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "bytes_received": self.bytes_received,
+            "latency_avg": self.latency_avg,
+            "latency_max": self.latency_max,
+            "last_latency": self.last_latency,
+            "latency_buckets": dict(
+                zip([*map(str, LATENCY_BUCKETS), "+Inf"], self.buckets)
+            ),
+        }
+
+
+class PumpspyStats:
+    """Request instrumentation collected by a Pumpspy client"""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self.endpoints: dict[str, EndpointStats] = {}
+        self.token_refreshes = 0
+
+    def endpoint(self, name: str) -> EndpointStats:
+        """Get (or create) the stats for an endpoint"""
+        stats = self.endpoints.get(name)
+        if stats is None:
+            stats = self.endpoints[name] = EndpointStats()
+        return stats
+
+    def total(self, attr: str) -> int:
+        """Sum a counter over all endpoints"""
+        return sum(getattr(stats, attr) for stats in self.endpoints.values())
+
+    def as_dict(self) -> dict:
+        """Plain dict representation"""
+        return {
+            "token_refreshes": self.token_refreshes,
+            "endpoints": {
+                name: stats.as_dict() for name, stats in self.endpoints.items()
+            },
+        }
+
+
+@dataclass
+class SectionStatus:
+    """Outcome of the latest fetch of one section of a poll"""
+
+    ok: bool = False
+    error: str | None = None
+    last_attempt: float | None = None
+    last_success: float | None = None
+
+    def record(self, error: str | None, now: float) -> None:
+        """Record a fetch, error is None when it succeeded"""
+        self.ok = error is None
+        self.error = error
+        self.last_attempt = now
+        if error is None:
+            self.last_success = now
+
+
+class RequestTrace:
+    """
+    Bounded ring of recent request summaries. Successful requests are
+    sampled, failed ones are always kept together with an excerpt of the
+    response body. Secrets (token, credentials) are redacted on the way in,
+    so the ring can be dumped as is.
+    """
+
+    def __init__(
+        self,
+        secrets: Callable[[], tuple] = tuple,
+        size: int = TRACE_SIZE,
+        sample_rate: float = TRACE_SAMPLE_RATE,
+    ) -> None:
+        """
+        Initialize.
+        secrets = returns the strings to redact, called for every entry so
+        a refreshed token is redacted too
+        """
+        self.secrets = secrets
+        self.sample_rate = sample_rate
+        self.entries: deque[dict] = deque(maxlen=size)
+
+    def redact(self, text: str) -> str:
+        """Replace the secrets found in text"""
+        for secret in self.secrets():
+            if secret and len(secret) >= TRACE_MIN_SECRET_SIZE:
+                text = text.replace(secret, REDACTED)
+        return text
+
+    def record(
+        self,
+        endpoint: str,
+        method: str,
+        url: str,
+        status: int | None,
+        latency: float,
+        size: int,
+        error: str | None = None,
+        body: bytes | None = None,
+    ) -> None:
+        """Keep the summary of a finished request, if sampled"""
+        failed = error is not None or status != 200
+        if not failed and random.random() >= self.sample_rate:
+            return
+        entry = {
+            "time": time.time(),
+            "endpoint": endpoint,
+            "method": method,
+            "url": self.redact(str(url)),
+            "status": status,
+            "latency": round(latency, 4),
+            "size": size,
+        }
+        if error is not None:
+            entry["error"] = self.redact(error)
+        if failed and body:
+            entry["body"] = self.redact(
+                body[:TRACE_EXCERPT_SIZE].decode(errors="replace")
+            )
+        self.entries.append(entry)
+
+    def as_list(self) -> list[dict]:
+        """Oldest first"""
+        return list(self.entries)
+
+
+class TokenBucket:
+    """Token bucket refilled at a constant rate"""
 
-    def __init__(self, username, password, device_id=None, iddevice_type=None) -> None:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        """Initialize."""
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available, 0 if one is available now"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        """Consume a token"""
+        self.tokens -= 1
+
+
+class RateLimiter:
+    """
+    Request rate limiter with a budget per host and per account.
+    Waiting requests are granted in priority order, then round robin over
+    the accounts (start-time fair queueing), then first come first served.
+    An account with a long backlog can't starve the others of the host
+    budget, and a request blocked by its own account budget does not hold
+    up requests of other accounts.
+    """
+
+    def __init__(
+        self,
+        host_rate: float = HOST_RATE,
+        host_burst: int = HOST_BURST,
+        account_rate: float = ACCOUNT_RATE,
+        account_burst: int = ACCOUNT_BURST,
+    ) -> None:
         """Initialize."""
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        self.account_rate = account_rate
+        self.account_burst = account_burst
+        self._hosts: dict[str, TokenBucket] = {}
+        self._accounts: dict[str, TokenBucket] = {}
+        self._waiters: list = []
+        self._seq = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+        # fair queueing tags: the last tag given to each account, and the
+        # tag of the last granted request
+        self._tags: dict[str, int] = {}
+        self._virtual = 0
+
+    def _bucket(self, buckets: dict, key: str, rate: float, burst: int):
+        """Get (or create) a bucket"""
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+    async def acquire(self, host: str, account: str, priority: int) -> None:
+        """Wait until a request to host on behalf of account may be sent"""
+        future = asyncio.get_running_loop().create_future()
+        tag = self._tags[account] = max(self._virtual, self._tags.get(account, 0)) + 1
+        heapq.heappush(
+            self._waiters, (priority, tag, next(self._seq), host, account, future)
+        )
+        self._dispatch()
+        await future
+
+    def _dispatch(self) -> None:
+        """Grant tokens to as many waiters as the budgets allow"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        retry_in = None
+        blocked = []
+        while self._waiters:
+            waiter = heapq.heappop(self._waiters)
+            _, tag, _, host, account, future = waiter
+            if future.done():  # cancelled while waiting
+                continue
+            host_bucket = self._bucket(
+                self._hosts, host, self.host_rate, self.host_burst
+            )
+            account_bucket = self._bucket(
+                self._accounts, account, self.account_rate, self.account_burst
+            )
+            wait = max(host_bucket.delay(now), account_bucket.delay(now))
+            if wait > 0:
+                blocked.append(waiter)
+                retry_in = wait if retry_in is None else min(retry_in, wait)
+                continue
+            host_bucket.take()
+            account_bucket.take()
+            self._virtual = max(self._virtual, tag - 1)
+            future.set_result(None)
+        for waiter in blocked:
+            heapq.heappush(self._waiters, waiter)
+        if retry_in is not None:
+            self._timer = asyncio.get_running_loop().call_later(
+                retry_in, self._dispatch
+            )
+
+
+# shared by every client in the process
+RATE_LIMITER = RateLimiter()
+
+
+class PumpspyAccount:
+    """
+    Login state of an account, shared by the clients of its devices: the
+    access token, the user id and, for accounts of an AccountRegistry, a
+    pool of connections to the server.
+    """
+
+    def __init__(
+        self, username, password, base_url=BASE_URL, pool_size: int | None = None
+    ) -> None:
+        """
+        Initialize.
+        pool_size = connections kept for the clients of the account, None to
+        let every request session use its own connections
+        """
         self.username = username
         self.password = password
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.access_token = None
+        self.uid = None
+        self.refs = 0
+        self.token_lock = asyncio.Lock()
+        self._connector: aiohttp.BaseConnector | None = None
+
+    def session(self, **kwargs) -> aiohttp.ClientSession:
+        """A request session, on the connection pool of the account if any"""
+        if self.pool_size is None:
+            return aiohttp.ClientSession(**kwargs)
+        if self._connector is None or self._connector.closed:
+            self._connector = aiohttp.TCPConnector(limit=self.pool_size)
+        return aiohttp.ClientSession(
+            connector=self._connector, connector_owner=False, **kwargs
+        )
+
+    async def close(self) -> None:
+        """Close the connection pool"""
+        if self._connector is not None:
+            await self._connector.close()
+            self._connector = None
+
+
+class AccountRegistry:
+    """
+    Accounts by user, reference counted by the clients using them, so the
+    devices of an account share one login, one connection pool and (through
+    the rate limiter) one request budget.
+    """
+
+    def __init__(self, pool_size: int = ACCOUNT_CONNECTIONS) -> None:
+        """Initialize."""
+        self.pool_size = pool_size
+        self._accounts: dict[tuple[str, str], PumpspyAccount] = {}
+
+    def acquire(self, username, password, base_url=BASE_URL) -> PumpspyAccount:
+        """Get (or create) the account of a user, adding a reference"""
+        key = (base_url, username)
+        account = self._accounts.get(key)
+        if account is None:
+            account = self._accounts[key] = PumpspyAccount(
+                username, password, base_url, self.pool_size
+            )
+        elif account.password != password:
+            # newest credentials win, the current token stays valid until
+            # it expires
+            account.password = password
+        account.refs += 1
+        return account
+
+    async def release(self, account: PumpspyAccount) -> None:
+        """Drop a reference, closing the account when it was the last"""
+        account.refs -= 1
+        if account.refs > 0:
+            return
+        key = (account.base_url, account.username)
+        if self._accounts.get(key) is account:
+            del self._accounts[key]
+        await account.close()
+
+
+class Pumpspy:
+    """Python class to talk to Pumpspy API"""
+
+    def __init__(
+        self,
+        username,
+        password,
+        device_id=None,
+        iddevice_type=None,
+        max_payload_size=MAX_PAYLOAD_SIZE,
+        rate_limiter: RateLimiter | None = None,
+        base_url=BASE_URL,
+        account: PumpspyAccount | None = None,
+    ) -> None:
+        """
+        Initialize.
+        account = login state shared with other clients of the same user,
+        see AccountRegistry. Takes precedence over username and password.
+        """
+        self.account = account or PumpspyAccount(username, password, base_url)
         self.device_name = None
         self.device_id = device_id
         self.iddevice_type = iddevice_type
-        self.access_token = None
-        self.uid = None
         self.lid = None
+        self.base_url = self.account.base_url
+        self.max_payload_size = max_payload_size
+        self.push_supported = None
+        self.rate_limiter = rate_limiter or RATE_LIMITER
+        self.stats = PumpspyStats()
+        self.trace = RequestTrace(
+            lambda: (self.access_token, self.password, self.username)
+        )
+
+    @property
+    def username(self):
+        """Account user name"""
+        return self.account.username
+
+    @property
+    def password(self):
+        """Account password"""
+        return self.account.password
+
+    @property
+    def access_token(self):
+        """Access token of the account"""
+        return self.account.access_token
+
+    @access_token.setter
+    def access_token(self, access_token) -> None:
+        self.account.access_token = access_token
+
+    @property
+    def uid(self):
+        """User id of the account"""
+        return self.account.uid
+
+    @uid.setter
+    def uid(self, uid) -> None:
+        self.account.uid = uid
+
+    def session(self, **kwargs) -> aiohttp.ClientSession:
+        """A request session, on the connection pool of the account if any"""
+        return self.account.session(**kwargs)
+
+    async def refresh_token(self, expired) -> None:
+        """
+        Replace an expired access token. When several clients of an account
+        find the same token expired, only the first one requests a new one.
+        """
+        async with self.account.token_lock:
+            if self.access_token == expired:
+                await self.get_token()
 
     async def setup(self) -> None:
         """Setup the class with access token and user id"""
-        await self.get_token()
-        async with aiohttp.ClientSession(headers=self.authed_headers()) as session:
-            await self.get_uid(session=session)
+        if self.access_token is None:
+            await self.refresh_token(None)
+        token = self.access_token
+        try:
+            await self._setup_device()
+        except InvalidAccessToken:
+            # the token shared with the other clients of the account expired
+            await self.refresh_token(token)
+            await self._setup_device()
+
+    async def _setup_device(self) -> None:
+        """Get the user id (once per account) and the device type"""
+        async with self.session(headers=self.authed_headers()) as session:
+            async with self.account.token_lock:
+                if self.uid is None:
+                    await self.get_uid(session=session)
             if self.device_id is not None:
 
                 # need to get the device type info so we know which endpoint to query
                 device_info = await self.get_device_info_from_id(session=session)
                 self.iddevice_type = device_info[0]["iddevice_types"]
                 self.device_name = device_info[0]["device_types_name"]
+                # fail early on device types we don't know the endpoints of
+                LOG.debug("Device capabilities: %s", self.device_type.capabilities)
 
                 # init_data = await self.fetch_current_data(session=session)
                 # LOG.debug("Got device nickname of %s", init_data[0]["user_nickname"])
                 # self.device_name = init_data[0]["user_nickname"]
 
+    async def _read_body(self, resp: aiohttp.ClientResponse) -> bytes:
+        """Read a response body, refusing anything over max_payload_size"""
+        if (
+            resp.content_length is not None
+            and resp.content_length > self.max_payload_size
+        ):
+            raise PayloadTooLarge(resp.url, resp.content_length)
+        body = bytearray()
+        async for chunk in resp.content.iter_chunked(READ_CHUNK_SIZE):
+            body += chunk
+            if len(body) > self.max_payload_size:
+                raise PayloadTooLarge(resp.url, len(body))
+        return bytes(body)
+
+    async def _request(
+        self,
+        session: aiohttp.ClientSession,
+        endpoint: str,
+        method: str,
+        url: str,
+        priority: int = PRIORITY_CURRENT,
+        **kwargs,
+    ):
+        """
+        Perform a rate limited request and record its latency, size and
+        outcome. The body is read once and decoded once.
+        Returns the status code and the decoded json body. Error responses
+        that are not json are returned as text, a successful response that
+        is not json raises InvalidResponse.
+        """
+        await self.rate_limiter.acquire(URL(url).host, self.username, priority)
+        stats = self.stats.endpoint(endpoint)
+        start = time.monotonic()
+        try:
+            async with session.request(method, url, **kwargs) as resp:
+                body = await self._read_body(resp)
+        except (
+            aiohttp.ClientError,
+            PayloadTooLarge,
+            asyncio.TimeoutError,
+            asyncio.CancelledError,
+        ) as err:
+            # timed out and cancelled (poll budget exceeded) requests count as
+            # failed too
+            latency = time.monotonic() - start
+            stats.observe(latency, 0, error=True)
+            self.trace.record(endpoint, method, url, None, latency, 0, repr(err))
+            raise
+        latency = time.monotonic() - start
+        stats.observe(latency, len(body), error=resp.status != 200)
+        self.trace.record(
+            endpoint, method, url, resp.status, latency, len(body), body=body
+        )
+        try:
+            response = json_loads(body)
+        except ValueError as err:
+            if resp.status == 200:
+                raise InvalidResponse(url, err) from err
+            response = body.decode(errors="replace")
+        return resp.status, response
+
+    async def _request_with_retry(
+        self,
+        session: aiohttp.ClientSession,
+        endpoint: str,
+        method: str,
+        url: str,
+        **kwargs,
+    ):
+        """
+        Perform a request, retrying dropped connections and timeouts up to
+        RETRY_ATTEMPTS times with a jittered exponential backoff. The last
+        error is raised once the attempts are used up.
+        """
+        for attempt in range(RETRY_ATTEMPTS):
+            try:
+                return await self._request(session, endpoint, method, url, **kwargs)
+            except RETRY_ERRORS as err:
+                if attempt == RETRY_ATTEMPTS - 1:
+                    raise
+                self.stats.endpoint(endpoint).retries += 1
+                delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2**attempt)
+                delay *= random.uniform(0.5, 1)
+                LOG.debug(
+                    "Oops, the server connection was dropped: %s, retrying in %.1fs",
+                    err,
+                    delay,
+                )
+                await asyncio.sleep(delay)  # don't hammer the server
+
     async def get_token(self) -> None:
         """Get bearer token"""
 
@@ -88,145 +722,96 @@ class Pumpspy:
             "password": self.password,
         }
 
-        async with aiohttp.ClientSession() as session:
-            while True:
-                try:
-                    async with session.post(
-                        f"{BASE_URL}{TOKEN_URL}",
-                        auth=aiohttp.BasicAuth(AUTH_USERNAME, AUTH_PASSWORD),
-                        headers=headers,
-                        data=data,
-                    ) as resp:
-                        if resp.status == 200:
-                            response = await resp.json()
-                            access_token = response["access_token"]
-                            LOG.debug("Got an access token of %s", access_token)
-                            self.access_token = access_token
-                        else:
-                            LOG.error(
-                                "Error getting authorization: %s", await resp.text()
-                            )
-                            return None
-                        break
-                except (
-                    aiohttp.ServerDisconnectedError,
-                    aiohttp.ClientResponseError,
-                    aiohttp.ClientConnectorError,
-                ) as err:
-                    LOG.debug("Oops, the server connection was dropped: %s", err)
-                    await asyncio.sleep(1)  # don't hammer the server
+        async with self.session() as session:
+            status, response = await self._request_with_retry(
+                session,
+                "token",
+                "POST",
+                f"{self.base_url}{TOKEN_URL}",
+                auth=aiohttp.BasicAuth(AUTH_USERNAME, AUTH_PASSWORD),
+                headers=headers,
+                data=data,
+            )
+        if status == 200:
+            self.access_token = response["access_token"]
+            LOG.debug("Got an access token")
+            self.stats.token_refreshes += 1
+        else:
+            LOG.error("Error getting authorization: %s", response)
 
     async def get_uid(self, session: aiohttp.ClientSession) -> None:  # GET UID
         """Get the uid of the user"""
-
-        # async with aiohttp.ClientSession() as session:
-        while True:
-            try:
-                async with session.get(
-                    f"{BASE_URL}{UID_URL}{self.username}", headers=self.authed_headers()
-                ) as resp:
-                    response = await resp.json()
-                    if resp.status == 200:
-                        uid = response[0]["uid"]
-                        LOG.debug("Got uid: %s", uid)
-                        self.uid = uid
-                        return
-                    elif resp.status == 401 and response["error"] == "invalid_token":
-                        raise InvalidAccessToken
-                    else:
-                        LOG.error("Error getting user id: %s", await resp.text())
-                        return None
-
-            except (
-                aiohttp.ServerDisconnectedError,
-                aiohttp.ClientResponseError,
-                aiohttp.ClientConnectorError,
-            ) as err:
-                LOG.debug("Oops, the server connection was dropped: %s", err)
-                await asyncio.sleep(1)  # don't hammer the server
+        status, response = await self._request_with_retry(
+            session,
+            "uid",
+            "GET",
+            f"{self.base_url}{UID_URL}{self.username}",
+            headers=self.authed_headers(),
+        )
+        if status == 200:
+            uid = response[0]["uid"]
+            LOG.debug("Got uid: %s", uid)
+            self.uid = uid
+        elif is_invalid_token(status, response):
+            raise InvalidAccessToken
+        else:
+            LOG.error("Error getting user id: %s", response)
 
     async def get_locations(self):
         """Get the available locations"""
-        async with aiohttp.ClientSession() as session:
-            while True:
-                try:
-                    async with session.get(
-                        f"{BASE_URL}{LOCATIONS_URL}{self.uid}",
-                        headers=self.authed_headers(),
-                    ) as resp:
-                        response = await resp.json()
-                        if resp.status == 200:
-                            LOG.debug("Got locations: %s", await resp.text())
-                            return response
-                        elif (
-                            resp.status == 401 and response["error"] == "invalid_token"
-                        ):
-                            raise InvalidAccessToken
-                        else:
-                            LOG.error("Error getting locations: %s", await resp.text())
-                            return None
-
-                except (
-                    aiohttp.ServerDisconnectedError,
-                    aiohttp.ClientResponseError,
-                    aiohttp.ClientConnectorError,
-                ) as err:
-                    LOG.debug("Oops, the server connection was dropped: %s", err)
-                    await asyncio.sleep(1)  # don't hammer the server
+        async with self.session() as session:
+            status, response = await self._request_with_retry(
+                session,
+                "locations",
+                "GET",
+                f"{self.base_url}{LOCATIONS_URL}{self.uid}",
+                headers=self.authed_headers(),
+            )
+        if status == 200:
+            LOG.debug("Got %s locations", len(response))
+            return response
+        elif is_invalid_token(status, response):
+            raise InvalidAccessToken
+        else:
+            LOG.error("Error getting locations: %s", response)
+            return None
 
     async def get_devices(self):
         """Get the available devices"""
-        async with aiohttp.ClientSession() as session:
-            while True:
-                try:
-                    async with session.get(
-                        f"{BASE_URL}{DEVICES_URL}{self.lid}",
-                        headers=self.authed_headers(),
-                    ) as resp:
-                        response = await resp.json()
-                        if resp.status == 200:
-                            LOG.debug("Got devices: %s", await resp.text())
-                            return response
-                        elif (
-                            resp.status == 401 and response["error"] == "invalid_token"
-                        ):
-                            raise InvalidAccessToken
-                        else:
-                            LOG.error("Error getting devices: %s", await resp.text())
-                            return None
-                except (
-                    aiohttp.ServerDisconnectedError,
-                    aiohttp.ClientResponseError,
-                    aiohttp.ClientConnectorError,
-                ) as err:
-                    LOG.debug("Oops, the server connection was dropped: %s", err)
-                    await asyncio.sleep(1)  # don't hammer the server
+        async with self.session() as session:
+            status, response = await self._request_with_retry(
+                session,
+                "devices",
+                "GET",
+                f"{self.base_url}{DEVICES_URL}{self.lid}",
+                headers=self.authed_headers(),
+            )
+        if status == 200:
+            LOG.debug("Got %s devices", len(response))
+            return response
+        elif is_invalid_token(status, response):
+            raise InvalidAccessToken
+        else:
+            LOG.error("Error getting devices: %s", response)
+            return None
 
     async def get_device_info_from_id(self, session: aiohttp.ClientSession):
         """Get the device info"""
-        # async with aiohttp.ClientSession() as session:
-        while True:
-            try:
-                async with session.get(
-                    f"{BASE_URL}/{DEVICEINFO_URL}/{self.device_id}",
-                    headers=self.authed_headers(),
-                ) as resp:
-                    response = await resp.json()
-                    if resp.status == 200:
-                        LOG.debug("Got device info: %s", await resp.text())
-                        return response
-                    elif resp.status == 401 and response["error"] == "invalid_token":
-                        raise InvalidAccessToken
-                    else:
-                        LOG.error("Error getting device info: %s", await resp.text())
-                        return None
-            except (
-                aiohttp.ServerDisconnectedError,
-                aiohttp.ClientResponseError,
-                aiohttp.ClientConnectorError,
-            ) as err:
-                LOG.debug("Oops, the server connection was dropped: %s", err)
-                await asyncio.sleep(1)  # don't hammer the server
+        status, response = await self._request_with_retry(
+            session,
+            "device_info",
+            "GET",
+            f"{self.base_url}/{DEVICEINFO_URL}/{self.device_id}",
+            headers=self.authed_headers(),
+        )
+        if status == 200:
+            LOG.debug("Got device info for %s", self.device_id)
+            return response
+        elif is_invalid_token(status, response):
+            raise InvalidAccessToken
+        else:
+            LOG.error("Error getting device info: %s", response)
+            return None
 
     def set_location(self, lid):
         """Setter for location id"""
@@ -236,56 +821,165 @@ class Pumpspy:
         """Getter for device id"""
         return {"deviceid": self.device_id, "device_name": self.device_name}
 
+    @property
+    def device_type(self) -> DeviceType | None:
+        """Registry entry of the device type, None before setup"""
+        if self.iddevice_type is None:
+            return None
+        device_type = DEVICE_TYPES.get(self.iddevice_type)
+        if device_type is None:
+            raise UnsupportedDeviceType(self.iddevice_type, self.device_name)
+        return device_type
+
+    @property
+    def capabilities(self) -> frozenset[str]:
+        """Capabilities of the device"""
+        if self.iddevice_type is None:
+            return frozenset()
+        return self.device_type.capabilities
+
     def has_backup(self):
         """Check if the device has a backup pump"""
-        if self.iddevice_type is None:
-            return False
-        return device_types[self.iddevice_type]["has_backup"]
-
-    async def fetch_data(self, intervals):
-        """Get all the data from the API"""
-        async with aiohttp.ClientSession(headers=self.authed_headers()) as session:
-            data = {"current": None, "ac": {}, "dc": {}}
-            while True:
+        return CAPABILITY_BACKUP in self.capabilities
+
+    async def fetch_data(self, intervals, budget: float = POLL_BUDGET, only=None):
+        """
+        Get all the data from the API.
+        The requests run concurrently and must finish within budget seconds,
+        each request's timeout being derived from the budget. Requests still
+        outstanding when it runs out are cancelled, and an expired access
+        token is renewed within what is left of it. Sections that didn't
+        arrive ("current" or "<motor>_<interval>") are listed in
+        data["stale"], with the reason in data["errors"].
+        only = optional collection of section names to fetch, e.g. to retry
+        the stale sections of a previous call
+        """
+        sections = ["current"] + [
+            f"{motor}_{interval}"
+            for interval in intervals
+            for motor in self.device_type.motors
+        ]
+        if only is not None:
+            sections = [section for section in sections if section in only]
+
+        timeout = aiohttp.ClientTimeout(
+            total=budget, sock_connect=budget * CONNECT_BUDGET_SHARE
+        )
+        token = self.access_token
+        deadline = time.monotonic() + budget
+        async with self.session(
+            headers=self.authed_headers(), timeout=timeout
+        ) as session:
+            tasks = {}
+            for section in sections:
+                if section == "current":
+                    coro = self.fetch_current_data(session=session)
+                else:
+                    motor, interval = section.split("_", 1)
+                    coro = self.fetch_interval_data(
+                        session=session, motor=motor, interval=interval
+                    )
+                tasks[asyncio.create_task(coro)] = section
+            try:
+                done, pending = await asyncio.wait(tasks, timeout=budget)
+            finally:
+                # also when the poll itself is cancelled, no request may
+                # outlive the session
+                unfinished = [task for task in tasks if not task.done()]
+                for task in unfinished:
+                    task.cancel()
+                if unfinished:
+                    await asyncio.gather(*unfinished, return_exceptions=True)
+            if pending:
+                LOG.debug(
+                    "Poll budget of %ss exceeded, cancelled: %s",
+                    budget,
+                    [tasks[task] for task in pending],
+                )
+
+        data = {"current": None, "ac": {}, "dc": {}, "stale": [], "errors": {}}
+        token_expired = False
+        for task, section in tasks.items():
+            result = None
+            error = "error response"
+            if task not in done:
+                error = "poll budget exceeded"
+            else:
                 try:
-                    data["current"] = await self.fetch_current_data(session=session)
-
-                    for interval in intervals:
-                        data["ac"][interval] = await self.fetch_interval_data(
-                            session=session, motor="ac", interval=interval
-                        )
-                        if self.has_backup() is True:
-                            data["dc"][interval] = await self.fetch_interval_data(
-                                session=session, motor="dc", interval=interval
-                            )
-                    LOG.debug(data)
-                    return data
+                    result = task.result()
                 except InvalidAccessToken:
-                    await self.get_token()
-                    await asyncio.sleep(1)  # don't hammer the server
-                    break
-
-                except (
-                    aiohttp.ServerDisconnectedError,
-                    aiohttp.ClientResponseError,
-                    aiohttp.ClientConnectorError,
-                ) as err:
+                    token_expired = True
+                    error = "access token expired"
+                except (PayloadTooLarge, InvalidResponse) as err:
+                    LOG.error(err)
+                    error = str(err)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as err:
                     LOG.debug("Oops, the server connection was dropped: %s", err)
-                    await asyncio.sleep(1)  # don't hammer the server
+                    error = repr(err)
+            if result is None:
+                data["stale"].append(section)
+                data["errors"][section] = error
+            elif section == "current":
+                data["current"] = result
+            else:
+                motor, interval = section.split("_", 1)
+                data[motor][interval] = result
+
+        if token_expired:
+            await self._refresh_token_within(token, deadline - time.monotonic())
+        if LOG.isEnabledFor(logging.DEBUG):
+            LOG.debug(
+                "Fetched %s of %s sections, stale: %s",
+                len(sections) - len(data["stale"]),
+                len(sections),
+                data["stale"],
+            )
+        return data
+
+    async def _refresh_token_within(self, expired, remaining: float) -> None:
+        """
+        Replace an expired access token within the rest of the poll budget.
+        When it doesn't make it, the next poll finds the token expired again
+        and retries.
+        """
+        if remaining <= 0:
+            LOG.debug("Expired access token, renewing it on the next poll")
+            return
+        LOG.debug("Expired access token, requesting a new one")
+        try:
+            await asyncio.wait_for(self.refresh_token(expired), remaining)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            LOG.debug("Renewing the access token failed, retrying next poll: %r", err)
+
+    def _current_url(self) -> str:
+        """Build the url of the current data endpoint"""
+        return f"{self.base_url}/{self.device_type.endpoint}/deviceid/{self.device_id}"
 
     async def fetch_current_data(self, session: aiohttp.ClientSession):
         """Get the current data"""
-        updated_url = f"{BASE_URL}/{device_types[self.iddevice_type]['endpoint']}/deviceid/{self.device_id}"
+        updated_url = self._current_url()
         LOG.debug("Querying api: %s", updated_url)
-        async with session.get(updated_url) as resp:
-            response = await resp.json()
-            if resp.status == 200:
-                return response
-            elif resp.status == 401 and response["error"] == "invalid_token":
-                raise InvalidAccessToken
-            else:
-                LOG.error("Error fetching current data: %s", await resp.text())
-                return None
+        status, response = await self._request(session, "current", "GET", updated_url)
+        if status == 200:
+            if (
+                not isinstance(response, list)
+                or not response
+                or not isinstance(response[0], dict)
+            ):
+                raise InvalidResponse(updated_url, "expected a list of status records")
+            return response
+        elif is_invalid_token(status, response):
+            raise InvalidAccessToken
+        else:
+            LOG.error("Error fetching current data: %s", response)
+            return None
+
+    def _interval_url(self, motor: str, interval: str) -> str:
+        """Build the url of an interval endpoint"""
+        updated_url = f"{self.base_url}/{self.device_type.interval_endpoint}_cycles/deviceid/{self.device_id}"
+        if self.has_backup() is True:
+            updated_url = f"{updated_url}/motor/{motor}"
+        return f"{updated_url}/interval/{interval}"
 
     async def fetch_interval_data(
         self, session: aiohttp.ClientSession, motor: str, interval: str
@@ -295,20 +989,191 @@ class Pumpspy:
         motor = "ac" for main, "dc" for backup
         interval = "day", "month", "week"
         """
-        updated_url = f"{BASE_URL}/{device_types[self.iddevice_type]['interval_endpoint']}_cycles/deviceid/{self.device_id}"
-        if self.has_backup() is True:
-            updated_url = f"{updated_url}/motor/{motor}"
-        updated_url = f"{updated_url}/interval/{interval}"
+        updated_url = self._interval_url(motor, interval)
         LOG.debug("Querying api: %s", updated_url)
-        async with session.get(updated_url) as resp:
-            response = await resp.json()
-            if resp.status == 200:
-                return response
-            elif resp.status == 401 and response["error"] == "invalid_token":
-                raise InvalidAccessToken
-            else:
-                LOG.error("Error fetching current data: %s", await resp.text())
-                return None
+        status, response = await self._request(
+            session,
+            f"interval_{interval}",
+            "GET",
+            updated_url,
+            priority=PRIORITY_INTERVAL,
+        )
+        if status == 200:
+            if not isinstance(response, list):
+                raise InvalidResponse(updated_url, "expected a list of buckets")
+            return response
+        elif is_invalid_token(status, response):
+            raise InvalidAccessToken
+        else:
+            LOG.error("Error fetching current data: %s", response)
+            return None
+
+    async def iter_interval_data(
+        self, session: aiohttp.ClientSession, motor: str, interval: str
+    ):
+        """
+        Iterate over the interval buckets as they are received, without
+        holding the whole response in memory. Meant for history backfills.
+        Raises aiohttp.ClientResponseError on an error status and
+        InvalidResponse when the body is not a json array.
+        motor = "ac" for main, "dc" for backup
+        interval = "day", "month", "week"
+        """
+        updated_url = self._interval_url(motor, interval)
+        LOG.debug("Streaming api: %s", updated_url)
+        await self.rate_limiter.acquire(
+            URL(updated_url).host, self.username, PRIORITY_HISTORY
+        )
+        stats = self.stats.endpoint(f"interval_{interval}")
+        start = time.monotonic()
+        received = 0
+        status = None
+        error = True
+        try:
+            async with session.get(updated_url) as resp:
+                status = resp.status
+                if resp.status != 200:
+                    body = await self._read_body(resp)
+                    received = len(body)
+                    if resp.status == 401 and b"invalid_token" in body:
+                        raise InvalidAccessToken
+                    raise aiohttp.ClientResponseError(
+                        resp.request_info,
+                        resp.history,
+                        status=resp.status,
+                        message=body[:TRACE_EXCERPT_SIZE].decode(errors="replace"),
+                    )
+                decoder = json.JSONDecoder()
+                text = codecs.getincrementaldecoder("utf-8")()
+                buffer = ""
+                started = False
+                async for chunk in resp.content.iter_chunked(READ_CHUNK_SIZE):
+                    received += len(chunk)
+                    if received > self.max_payload_size:
+                        raise PayloadTooLarge(resp.url, received)
+                    buffer += text.decode(chunk)
+                    while True:
+                        buffer = buffer.lstrip(" \t\r\n,")
+                        if not started:
+                            if not buffer:
+                                break
+                            if buffer[0] != "[":
+                                raise InvalidResponse(resp.url, "expected a json array")
+                            buffer = buffer[1:]
+                            started = True
+                            continue
+                        if buffer.startswith("]"):
+                            error = False
+                            return
+                        try:
+                            bucket, end = decoder.raw_decode(buffer)
+                        except ValueError:
+                            break  # wait for the rest of the record
+                        buffer = buffer[end:]
+                        yield bucket
+                raise InvalidResponse(resp.url, "truncated json array")
+        finally:
+            latency = time.monotonic() - start
+            stats.observe(latency, received, error=error)
+            self.trace.record(
+                f"interval_{interval}",
+                "GET",
+                updated_url,
+                status,
+                latency,
+                received,
+                "incomplete stream" if error and status == 200 else None,
+            )
+
+    async def watch_current(self, poll_interval: float = WATCH_INTERVAL):
+        """
+        Yield the current data every time it changes.
+        Subscribes to a server-sent event stream on the status endpoint when
+        the server offers one, otherwise polls the status endpoint. The
+        stream doesn't use the connection pool of the account.
+        """
+        last = None
+        while True:
+            token = self.access_token
+            try:
+                if self.push_supported is False:
+                    async with self.session(headers=self.authed_headers()) as session:
+                        current = await self.fetch_current_data(session=session)
+                    if current is not None and current != last:
+                        last = current
+                        yield current
+                else:
+                    # the stream holds its connection for as long as it lasts,
+                    # so it gets one of its own instead of one of the pool the
+                    # polls of the account share
+                    async with aiohttp.ClientSession(
+                        headers=self.authed_headers()
+                    ) as session:
+                        async for current in self._stream_current(session, last):
+                            last = current
+                            yield current
+            except InvalidAccessToken:
+                LOG.debug("Expired access token, requesting a new one")
+                await self.refresh_token(token)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as err:
+                LOG.debug("Status watch interrupted: %s", err)
+                self.stats.endpoint("watch").retries += 1
+            await asyncio.sleep(poll_interval)
+
+    async def _stream_current(self, session: aiohttp.ClientSession, last):
+        """
+        Yield current data from the server-sent event stream of the status
+        endpoint. An event holds either a full status list or a dict of
+        changed fields, which is merged into the last record. If the server
+        answers with plain json instead, that answer is yielded once and
+        push_supported is cleared so the caller falls back to polling.
+        """
+        updated_url = self._current_url()
+        await self.rate_limiter.acquire(
+            URL(updated_url).host, self.username, PRIORITY_CURRENT
+        )
+        async with session.get(
+            updated_url,
+            headers={"Accept": "text/event-stream"},
+            timeout=aiohttp.ClientTimeout(total=None, sock_read=WATCH_IDLE_TIMEOUT),
+        ) as resp:
+            if resp.content_type != "text/event-stream":
+                body = await self._read_body(resp)
+                if resp.status == 401 and b"invalid_token" in body:
+                    raise InvalidAccessToken
+                if resp.status != 200:
+                    LOG.error(
+                        "Error fetching current data: %s",
+                        body.decode(errors="replace"),
+                    )
+                    return
+                if self.push_supported is None:
+                    LOG.debug("No event stream on %s, polling instead", updated_url)
+                self.push_supported = False
+                current = json_loads(body)
+                if current != last:
+                    yield current
+                return
+
+            LOG.debug("Subscribed to %s", updated_url)
+            self.push_supported = True
+            lines = []
+            async for raw_line in resp.content:
+                line = raw_line.decode().rstrip("\r\n")
+                if line.startswith("data:"):
+                    lines.append(line[5:].lstrip())
+                    continue
+                if line or not lines:
+                    continue
+                event = json_loads("\n".join(lines))
+                lines = []
+                if isinstance(event, dict):
+                    if not last:
+                        continue
+                    event = [{**last[0], **event}]
+                if event != last:
+                    last = event
+                    yield event
 
     def authed_headers(self):
         "Return headers with bearer token"
@@ -321,4 +1186,238 @@ class Pumpspy:
 class InvalidAccessToken(Exception):
     """Class excpetion for expired"""
 
-    LOG.debug("Expired access token found on %s", date.today())
+
+def is_invalid_token(status, response) -> bool:
+    """The response rejects the access token"""
+    return (
+        status == 401
+        and isinstance(response, dict)
+        and response.get("error") == "invalid_token"
+    )
+
+
+class InvalidResponse(ValueError):
+    """Successful response whose body is not what the endpoint returns"""
+
+    def __init__(self, url, reason) -> None:
+        """Initialize."""
+        super().__init__(f"Invalid response from {url}: {reason}")
+
+
+class UnsupportedDeviceType(Exception):
+    """Device type missing from DEVICE_TYPES"""
+
+    def __init__(self, iddevice_type, name) -> None:
+        """Initialize."""
+        super().__init__(f"Unsupported device type {iddevice_type} ({name})")
+
+
+class PayloadTooLarge(Exception):
+    """Response body over the configured maximum size"""
+
+    def __init__(self, url, size) -> None:
+        """Initialize."""
+        super().__init__(f"Response from {url} exceeds the size limit ({size} bytes)")
+
+
+class NdjsonSink:
+    """Write poll results to a stream as newline-delimited json"""
+
+    def __init__(self, stream) -> None:
+        """Initialize."""
+        self.stream = stream
+
+    def write(self, record: dict) -> None:
+        """Write a single record"""
+        self.stream.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.stream.flush()
+
+    def close(self) -> None:
+        """Nothing to release"""
+
+
+class SqliteSink:
+    """Append poll results to a SQLite database"""
+
+    def __init__(self, path: str) -> None:
+        """Initialize."""
+        import sqlite3  # pylint: disable=import-outside-toplevel
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS readings "
+            "(deviceid INTEGER, time REAL, kind TEXT, payload TEXT)"
+        )
+
+    def write(self, record: dict) -> None:
+        """Write a single record"""
+        self.conn.execute(
+            "INSERT INTO readings VALUES (?, ?, ?, ?)",
+            (
+                record.get("deviceid"),
+                record["time"],
+                record["kind"],
+                json.dumps(record["data"], separators=(",", ":")),
+            ),
+        )
+        self.conn.commit()
+
+    def close(self) -> None:
+        """Close the database"""
+        self.conn.close()
+
+
+async def discover(username, password, sink) -> None:
+    """Write every location and device of an account to the sink"""
+    client = Pumpspy(username=username, password=password)
+    await client.setup()
+    for location in await client.get_locations() or []:
+        sink.write({"time": time.time(), "kind": "location", "data": location})
+        client.set_location(location["lid"])
+        for device in await client.get_devices() or []:
+            sink.write(
+                {
+                    "deviceid": device["deviceid"],
+                    "time": time.time(),
+                    "kind": "device",
+                    "data": device,
+                }
+            )
+
+
+async def poll(username, password, device_ids, intervals, every, once, sink) -> None:
+    """Poll devices concurrently, writing each result as soon as it arrives"""
+    # one login and connection pool for all the devices
+    account = PumpspyAccount(username, password, pool_size=ACCOUNT_CONNECTIONS)
+    clients = [
+        Pumpspy(
+            username=username, password=password, device_id=device_id, account=account
+        )
+        for device_id in device_ids
+    ]
+    try:
+        await asyncio.gather(
+            *(_poll_client(client, intervals, every, once, sink) for client in clients)
+        )
+    finally:
+        await account.close()
+
+
+async def _poll_client(client, intervals, every, once, sink) -> None:
+    """
+    Set up and poll one device until cancelled (or once). A failed setup or
+    poll is logged and retried with a backoff, so one device can't stop the
+    others.
+    """
+    ready = False
+    failures = 0
+    while True:
+        try:
+            if not ready:
+                await client.setup()
+                ready = True
+            data = await client.fetch_data(intervals=intervals)
+        except UnsupportedDeviceType as err:
+            # no retry will make it supported
+            LOG.error("Not polling device %s: %s", client.device_id, err)
+            return
+        except Exception as err:  # pylint: disable=broad-except
+            failures += 1
+            delay = min(every, RETRY_BACKOFF_MAX * 2 ** (failures - 1))
+            if isinstance(
+                err,
+                (
+                    InvalidAccessToken,
+                    InvalidResponse,
+                    aiohttp.ClientError,
+                    asyncio.TimeoutError,
+                ),
+            ):
+                LOG.warning(
+                    "Polling device %s failed, retrying in %.0fs: %r",
+                    client.device_id,
+                    delay,
+                    err,
+                )
+            else:
+                LOG.exception(
+                    "Unexpected error polling device %s, retrying in %.0fs",
+                    client.device_id,
+                    delay,
+                )
+            if once:
+                return
+            await asyncio.sleep(delay)
+            continue
+        failures = 0
+        sink.write(
+            {
+                "deviceid": client.device_id,
+                "time": time.time(),
+                "kind": "poll",
+                "data": data,
+            }
+        )
+        if once:
+            return
+        await asyncio.sleep(every)
+
+
+def main(argv=None) -> None:
+    """Command line entry point"""
+    import argparse  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(
+        description="Poll Pumpspy devices outside of Home Assistant"
+    )
+    parser.add_argument("--username", required=True, help="account email")
+    parser.add_argument(
+        "--password",
+        default=os.environ.get("PUMPSPY_PASSWORD"),
+        help="account password (default: $PUMPSPY_PASSWORD)",
+    )
+    parser.add_argument("--sqlite", help="write to this SQLite database")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("discover", help="list locations and devices")
+    poll_parser = commands.add_parser("poll", help="poll devices")
+    poll_parser.add_argument("device", nargs="+", type=int, help="device id")
+    poll_parser.add_argument(
+        "--interval",
+        action="append",
+        choices=["day", "week", "month"],
+        help="interval data to fetch (default: day)",
+    )
+    poll_parser.add_argument(
+        "--every", type=float, default=300, help="seconds between polls"
+    )
+    poll_parser.add_argument("--once", action="store_true", help="poll once and exit")
+    args = parser.parse_args(argv)
+
+    if args.password is None:
+        parser.error("--password or $PUMPSPY_PASSWORD is required")
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+
+    sink = SqliteSink(args.sqlite) if args.sqlite else NdjsonSink(sys.stdout)
+    try:
+        if args.command == "discover":
+            coro = discover(args.username, args.password, sink)
+        else:
+            coro = poll(
+                args.username,
+                args.password,
+                args.device,
+                args.interval or ["day"],
+                args.every,
+                args.once,
+                sink,
+            )
+        asyncio.run(coro)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.close()
+
+
+if __name__ == "__main__":
+    main()
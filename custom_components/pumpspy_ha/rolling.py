@@ -0,0 +1,92 @@
+"""Downsampled rolling statistics for Pumpspy-HA."""
+from __future__ import annotations
+
+import math
+
+
+class RollingStats:
+    """
+    Ring buffer of fixed width time buckets, each keeping the count, sum,
+    min and max of the samples that fell in it. The window aggregates are
+    recomputed once per sample, and when window() moves the window past
+    buckets, so reading them is constant time.
+    """
+
+    __slots__ = (
+        "width",
+        "size",
+        "_count",
+        "_sum",
+        "_min",
+        "_max",
+        "_head",
+        "min",
+        "max",
+        "average",
+    )
+
+    def __init__(self, window: float, size: int) -> None:
+        """Initialize a window of window seconds split in size buckets."""
+        self.width = window / size
+        self.size = size
+        self._count = [0] * size
+        self._sum = [0.0] * size
+        self._min = [math.inf] * size
+        self._max = [-math.inf] * size
+        self._head: int | None = None
+        self.min: float | None = None
+        self.max: float | None = None
+        self.average: float | None = None
+
+    def add(self, timestamp: float, value: float) -> None:
+        """Add a sample taken at timestamp (seconds)"""
+        bucket = int(timestamp // self.width)
+        if self._head is None:
+            self._head = bucket
+        elif bucket < self._head - self.size + 1:
+            return  # older than the window
+        else:
+            self._advance(bucket)
+
+        index = bucket % self.size
+        self._count[index] += 1
+        self._sum[index] += value
+        self._min[index] = min(self._min[index], value)
+        self._max[index] = max(self._max[index], value)
+        self._aggregate()
+
+    def window(self, timestamp: float) -> RollingStats:
+        """
+        Move the window up to timestamp (seconds), dropping the samples it
+        moved past, and return it
+        """
+        if self._advance(int(timestamp // self.width)):
+            self._aggregate()
+        return self
+
+    def _advance(self, bucket: int) -> bool:
+        """Move the head to bucket, True when the window moved"""
+        if self._head is None or bucket <= self._head:
+            return False
+        # clear the buckets the window moved past
+        for stale in range(self._head + 1, min(bucket, self._head + self.size) + 1):
+            self._clear(stale % self.size)
+        self._head = bucket
+        return True
+
+    def _clear(self, index: int) -> None:
+        """Empty a bucket"""
+        self._count[index] = 0
+        self._sum[index] = 0.0
+        self._min[index] = math.inf
+        self._max[index] = -math.inf
+
+    def _aggregate(self) -> None:
+        """Recompute the window aggregates"""
+        count = sum(self._count)
+        if count == 0:
+            self.min = self.max = self.average = None
+            return
+        self.min = min(self._min)
+        self.max = max(self._max)
+        self.average = sum(self._sum) / count
@@ -1,23 +1,38 @@
 """Platform for sensor integration."""
 from __future__ import annotations
 
+from dataclasses import dataclass
 from datetime import date, datetime
 from decimal import Decimal
+from functools import lru_cache
+import time
 from typing import Any
-from collections.abc import Mapping
-import pytz
+from collections.abc import Callable, Mapping
 
 from homeassistant.helpers.typing import StateType
-from .entity import PumpspyEntity
+from .entity import PumpspyEntity, PumpspyEntityDescription
+from .pypumpspy import (
+    CAPABILITY_BACKUP,
+    CAPABILITY_CYCLES,
+    CAPABILITY_RHT,
+    CAPABILITY_STATUS,
+    DeviceType,
+)
 
 # from .pumpspy_ha import PumpspyEntity, pumpspy
 from homeassistant.const import (
     PERCENTAGE,
+    UnitOfTemperature,
+    UnitOfTime,
     UnitOfVolume,
 )
+from homeassistant.core import callback
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+from homeassistant.helpers.entity import DeviceInfo, EntityCategory
 from homeassistant.components.sensor import (
     SensorDeviceClass,
     SensorEntity,
+    SensorEntityDescription,
     SensorStateClass,
 )
 from homeassistant.util import dt
@@ -25,242 +40,377 @@ from .const import (
     CONF_BACKUP_PUMP,
     CONF_CYCLES,
     CONF_DAILY,
-    CONF_DEVICE_NAME,
-    CONF_DEVICEID,
     CONF_GALLONS,
     CONF_MAIN_PUMP,
     CONF_MONTHLY,
     CONF_WEEKLY,
+    DATA_FLEET,
     DOMAIN,
+    MANUFACTURER,
+    RHT_HUMIDITY,
+    RHT_TEMPERATURE,
+    SIGNAL_FLEET_ORPHANED,
+    STAT_ERRORS,
+    STAT_LATENCY,
+    STAT_REQUESTS,
+    STAT_RETRIES,
 )
 
 interval_names = {"day": CONF_DAILY, "week": CONF_WEEKLY, "month": CONF_MONTHLY}
 
 
-async def async_setup_entry(hass, config_entry, async_add_entities):
-    """Add sensors for passed config_entry in HA."""
-    coordinator = hass.data[DOMAIN][config_entry.entry_id]
+def current_bucket_value(buckets, interval: str, key: str):
+    """
+    Get a value from the newest interval bucket.
+    interval = "day", "week", "month"
+    Returns 0 if the newest bucket is not the current day/week/month.
+    """
+    try:
+        data = buckets[0]
+        now = datetime.now()
+        if data["year_num"] != now.year:
+            return 0
+        elif interval == "week" and data["week_num"] == now.isocalendar().week:
+            return data[key]
+        elif data["month_num"] == now.month:
+            if interval == "day" and data["day_num"] == now.day:
+                return data[key]
+            elif interval == "month":
+                return data[key]
+            else:
+                return 0
+        else:
+            return 0
+    except Exception:  # pylint: disable=broad-except
+        return 0
 
-    new_devices = [
-        SignalStrengthSensor(coordinator=coordinator),
-        LastCycleSensor(coordinator=coordinator, pump=CONF_MAIN_PUMP),
-    ]
 
-    for interval in coordinator.intervals:
-        new_devices.append(
-            TotalingSensor(
-                coordinator=coordinator,
-                pump=CONF_MAIN_PUMP,
-                sensor_type=CONF_CYCLES,
-                interval=interval_names[interval],
-            )
-        )
-        new_devices.append(
-            TotalingSensor(
-                coordinator=coordinator,
-                pump=CONF_MAIN_PUMP,
-                sensor_type=CONF_GALLONS,
-                interval=interval_names[interval],
-            )
-        )
+@dataclass(frozen=True, kw_only=True)
+class PumpspySensorEntityDescription(SensorEntityDescription, PumpspyEntityDescription):
+    """Describes a Pumpspy sensor."""
 
-        # add the backup pump sensors if the device has it
-        if coordinator.api.has_backup() is True:
-            new_devices.append(
-                TotalingSensor(
-                    coordinator=coordinator,
-                    pump=CONF_BACKUP_PUMP,
-                    sensor_type=CONF_CYCLES,
-                    interval=interval_names[interval],
-                )
-            )
-            new_devices.append(
-                TotalingSensor(
-                    coordinator=coordinator,
-                    pump=CONF_BACKUP_PUMP,
-                    sensor_type=CONF_GALLONS,
-                    interval=interval_names[interval],
-                )
-            )
-
-    # add backup pump related items if applicable
-    if coordinator.api.has_backup() is True:
-        new_devices.append(
-            LastCycleSensor(coordinator=coordinator, pump=CONF_BACKUP_PUMP)
-        )
-        new_devices.append(BatterySensor(coordinator=coordinator))
+    value_fn: Callable[[Any], StateType | date | datetime | Decimal]
+    attributes_fn: Callable[[Any], Mapping[str, Any] | None] | None = None
 
-    if new_devices:
-        async_add_entities(new_devices)
 
+def _status(coordinator) -> dict:
+    """Latest status record"""
+    return coordinator.data["current"][0]
 
-class SignalStrengthSensor(PumpspyEntity, SensorEntity):
-    """Signal Strength Sensor"""
 
-    def __init__(self, coordinator) -> None:
-        """Initialize the sensor."""
-        super().__init__(coordinator=coordinator)
-        self._available = True
-        self._attr_native_unit_of_measurement = "dBm"
-        self._attr_device_class = SensorDeviceClass.SIGNAL_STRENGTH
+def _timestamp(value) -> datetime:
+    """Convert a millisecond timestamp"""
+    return dt.utc_from_timestamp(value / 1000)
 
-        device_info = self.coordinator.api.get_device_info()
 
-        self._attr_unique_id = f"{device_info[CONF_DEVICEID]}_rssi"
-        self._attr_name = f"{device_info[CONF_DEVICE_NAME]} RSSI"
+def _last_cycle(pump: str) -> PumpspySensorEntityDescription:
+    """Time and duration of the last cycle of a pump"""
+    pre_key = "" if pump == CONF_MAIN_PUMP else "backup_"
+    return PumpspySensorEntityDescription(
+        key=f"{pump}_last_cycle",
+        name=f"{pump.title()} Last Cycle",
+        device_class=SensorDeviceClass.TIMESTAMP,
+        fields=frozenset({f"{pre_key}lastcycletime", f"{pre_key}cycleduration"}),
+        value_fn=lambda coordinator: _timestamp(
+            _status(coordinator)[f"{pre_key}lastcycletime"]
+        ),
+        attributes_fn=lambda coordinator: {
+            "duration": round(_status(coordinator)[f"{pre_key}cycleduration"] / 1000, 1)
+        },
+    )
 
-    @property
-    def native_value(self) -> StateType | date | datetime | Decimal:
-        """Get value"""
-        return self.coordinator.data["current"][0]["last_rssi"]
 
-    @property
-    def extra_state_attributes(self) -> Mapping[str, Any] | None:
+def _rht_attributes(field: str):
+    """Rolling hour and day statistics of a reading"""
+
+    def _attributes(coordinator) -> Mapping[str, Any]:
+        # without new samples the windows still move on
+        now = time.time()
+        hour, day = (window.window(now) for window in coordinator.rht_stats[field])
         return {
-            "last_rssi_time": dt.as_utc(
-                datetime.fromtimestamp(
-                    self.coordinator.data["current"][0]["last_rssi_time"] / 1000,
-                    pytz.UTC,
-                )
-            )
+            "hour_min": hour.min,
+            "hour_max": hour.max,
+            "hour_average": None if hour.average is None else round(hour.average, 1),
+            "day_min": day.min,
+            "day_max": day.max,
+            "day_average": None if day.average is None else round(day.average, 1),
         }
 
+    return _attributes
+
+
+def _latency_attributes(coordinator) -> Mapping[str, Any]:
+    """Average and max latency of the status endpoint"""
+    current = coordinator.api.stats.endpoint("current")
+    return {
+        "average": None
+        if current.latency_avg is None
+        else round(current.latency_avg * 1000),
+        "max": round(current.latency_max * 1000),
+    }
+
+
+def _latency(coordinator) -> int | None:
+    """Latency of the last status request"""
+    latency = coordinator.api.stats.endpoint("current").last_latency
+    return None if latency is None else round(latency * 1000)
+
+
+# sensors of each device capability
+SENSORS: dict[str, tuple[PumpspySensorEntityDescription, ...]] = {
+    CAPABILITY_STATUS: (
+        PumpspySensorEntityDescription(
+            key="rssi",
+            name="RSSI",
+            native_unit_of_measurement="dBm",
+            device_class=SensorDeviceClass.SIGNAL_STRENGTH,
+            fields=frozenset({"last_rssi", "last_rssi_time"}),
+            value_fn=lambda coordinator: _status(coordinator)["last_rssi"],
+            attributes_fn=lambda coordinator: {
+                "last_rssi_time": _timestamp(_status(coordinator)["last_rssi_time"])
+            },
+        ),
+    ),
+    CAPABILITY_CYCLES: (_last_cycle(CONF_MAIN_PUMP),),
+    CAPABILITY_BACKUP: (
+        _last_cycle(CONF_BACKUP_PUMP),
+        PumpspySensorEntityDescription(
+            key="battery",
+            name="Battery",
+            native_unit_of_measurement=PERCENTAGE,
+            device_class=SensorDeviceClass.BATTERY,
+            fields=frozenset(
+                {
+                    "battery_charge_percentage",
+                    "battery_voltage",
+                    "battery_estimated_life",
+                    "battery_tested_time",
+                    "battery_updated",
+                }
+            ),
+            value_fn=lambda coordinator: _status(coordinator)[
+                "battery_charge_percentage"
+            ],
+            attributes_fn=lambda coordinator: {
+                "voltage": _status(coordinator)["battery_voltage"] / 1000,
+                "estimated_life": round(
+                    _status(coordinator)["battery_estimated_life"], 1
+                ),
+                "tested_time": _timestamp(_status(coordinator)["battery_tested_time"]),
+                "updated": _timestamp(_status(coordinator)["battery_updated"]),
+            },
+        ),
+    ),
+    CAPABILITY_RHT: tuple(
+        PumpspySensorEntityDescription(
+            key=field,
+            name=field.title(),
+            state_class=SensorStateClass.MEASUREMENT,
+            device_class=device_class,
+            native_unit_of_measurement=unit,
+            fields=frozenset({field}),
+            value_fn=lambda coordinator, field=field: _status(coordinator).get(field),
+            attributes_fn=_rht_attributes(field),
+        )
+        for field, device_class, unit in (
+            (
+                RHT_TEMPERATURE,
+                SensorDeviceClass.TEMPERATURE,
+                UnitOfTemperature.FAHRENHEIT,
+            ),
+            (RHT_HUMIDITY, SensorDeviceClass.HUMIDITY, PERCENTAGE),
+        )
+    ),
+}
+
+# client instrumentation of every device, disabled by default
+STAT_SENSORS: tuple[PumpspySensorEntityDescription, ...] = (
+    PumpspySensorEntityDescription(
+        key=STAT_LATENCY,
+        name="Api Latency",
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        entity_category=EntityCategory.DIAGNOSTIC,
+        entity_registry_enabled_default=False,
+        value_fn=_latency,
+        attributes_fn=_latency_attributes,
+    ),
+    PumpspySensorEntityDescription(
+        key=STAT_REQUESTS,
+        name="Api Requests",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        entity_category=EntityCategory.DIAGNOSTIC,
+        entity_registry_enabled_default=False,
+        value_fn=lambda coordinator: coordinator.api.stats.total("requests"),
+        attributes_fn=lambda coordinator: {
+            "token_refreshes": coordinator.api.stats.token_refreshes,
+            "bytes_received": coordinator.api.stats.total("bytes_received"),
+        },
+    ),
+    PumpspySensorEntityDescription(
+        key=STAT_ERRORS,
+        name="Api Errors",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        entity_category=EntityCategory.DIAGNOSTIC,
+        entity_registry_enabled_default=False,
+        value_fn=lambda coordinator: coordinator.api.stats.total("errors"),
+    ),
+    PumpspySensorEntityDescription(
+        key=STAT_RETRIES,
+        name="Api Retries",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        entity_category=EntityCategory.DIAGNOSTIC,
+        entity_registry_enabled_default=False,
+        value_fn=lambda coordinator: coordinator.api.stats.total("retries"),
+    ),
+)
 
-class BatterySensor(PumpspyEntity, SensorEntity):
-    """Battery Sensor"""
 
-    def __init__(self, coordinator):
-        """Initialize the sensor."""
-        super().__init__(coordinator=coordinator)
-        self._available = True
-        self._attr_native_unit_of_measurement = PERCENTAGE
-        self._attr_device_class = SensorDeviceClass.BATTERY
+def _total(motor: str, interval: str, sensor_type: str):
+    """Cycles or gallons of the current day/week/month"""
+    key = "total_count" if sensor_type == CONF_CYCLES else sensor_type
 
-        device_info = self.coordinator.api.get_device_info()
+    def _value(coordinator):
+        try:
+            buckets = coordinator.data[motor][interval]
+        except (KeyError, TypeError):
+            return 0
+        return current_bucket_value(buckets, interval, key)
+
+    return _value
+
+
+# cycles and gallons of each motor and interval
+TOTAL_SENSORS: dict[tuple[str, str], tuple[PumpspySensorEntityDescription, ...]] = {
+    (motor, interval): tuple(
+        PumpspySensorEntityDescription(
+            key=f"{pump}_{interval_names[interval]}_{sensor_type}",
+            name=f"{pump} {interval_names[interval]} {sensor_type}".title(),
+            state_class=SensorStateClass.TOTAL_INCREASING,
+            native_unit_of_measurement=UnitOfVolume.GALLONS
+            if sensor_type == CONF_GALLONS
+            else None,
+            fields=frozenset({f"{motor}_{interval}", "date"}),
+            value_fn=_total(motor, interval, sensor_type),
+        )
+        for sensor_type in (CONF_CYCLES, CONF_GALLONS)
+    )
+    for motor, pump in (("ac", CONF_MAIN_PUMP), ("dc", CONF_BACKUP_PUMP))
+    for interval in interval_names
+}
+
+
+@lru_cache
+def sensor_descriptions(
+    device_type: DeviceType, intervals: tuple[str, ...]
+) -> tuple[PumpspySensorEntityDescription, ...]:
+    """Every sensor of a device type polling the given intervals"""
+    descriptions = []
+    for capability in (
+        CAPABILITY_STATUS,
+        CAPABILITY_CYCLES,
+        CAPABILITY_BACKUP,
+        CAPABILITY_RHT,
+    ):
+        if capability in device_type.capabilities:
+            descriptions.extend(SENSORS[capability])
+    for interval in intervals:
+        for motor in device_type.motors:
+            descriptions.extend(TOTAL_SENSORS[(motor, interval)])
+    descriptions.extend(STAT_SENSORS)
+    return tuple(descriptions)
 
-        self._attr_unique_id = f"{device_info[CONF_DEVICEID]}_battery"
-        self._attr_name = f"{device_info[CONF_DEVICE_NAME]} Battery"
 
-    @property
-    def native_value(self) -> StateType | date | datetime | Decimal:
-        """Native value"""
-        return self.coordinator.data["current"][0]["battery_charge_percentage"]
+async def async_setup_entry(hass, config_entry, async_add_entities):
+    """Add sensors for passed config_entry in HA."""
+    coordinator = hass.data[DOMAIN][config_entry.entry_id]
 
-    @property
-    def extra_state_attributes(self) -> Mapping[str, Any] | None:
-        """Attributes"""
-        return {
-            "voltage": self.coordinator.data["current"][0]["battery_voltage"] / 1000,
-            "estimated_life": round(
-                self.coordinator.data["current"][0]["battery_estimated_life"], 1
-            ),
-            "tested_time": dt.as_utc(
-                datetime.fromtimestamp(
-                    self.coordinator.data["current"][0]["battery_tested_time"] / 1000,
-                    pytz.UTC,
-                )
-            ),
-            "updated": dt.as_utc(
-                datetime.fromtimestamp(
-                    self.coordinator.data["current"][0]["battery_updated"] / 1000,
-                    pytz.UTC,
-                )
-            ),
-        }
+    new_devices = [
+        PumpspySensor(coordinator=coordinator, description=description)
+        for description in sensor_descriptions(
+            coordinator.api.device_type, tuple(coordinator.intervals)
+        )
+    ]
 
+    # the first entry to load owns the fleet wide sensors, the others take
+    # them over when it unloads
+    fleet = hass.data.get(DATA_FLEET)
+    if fleet is not None:
+
+        @callback
+        def _async_adopt_fleet() -> None:
+            if fleet.owner is None:
+                fleet.owner = config_entry.entry_id
+                async_add_entities(fleet_sensors(fleet))
+
+        if fleet.owner is None:
+            fleet.owner = config_entry.entry_id
+            new_devices.extend(fleet_sensors(fleet))
+        config_entry.async_on_unload(
+            async_dispatcher_connect(hass, SIGNAL_FLEET_ORPHANED, _async_adopt_fleet)
+        )
 
-class TotalingSensor(PumpspyEntity, SensorEntity):
-    """Totaling Sensor"""
+    if new_devices:
+        async_add_entities(new_devices)
 
-    def __init__(self, coordinator, pump: str, sensor_type: str, interval: str):
-        """Initialize the sensor."""
-        super().__init__(coordinator=coordinator)
-        self._available = True
-        self._attr_state_class = SensorStateClass.TOTAL_INCREASING
-        self._pump = pump
-        self._type = sensor_type
-        self._interval = interval
-        self._motor = "ac" if pump == CONF_MAIN_PUMP else "dc"
-
-        self._interval_converted = None
-        if interval == CONF_DAILY:
-            self._interval_converted = "day"
-        elif interval == CONF_WEEKLY:
-            self._interval_converted = "week"
-        elif interval == CONF_MONTHLY:
-            self._interval_converted = "month"
-
-        device_info = self.coordinator.api.get_device_info()
-        if sensor_type == "gallons":
-            self._attr_native_unit_of_measurement = UnitOfVolume.GALLONS
 
-        self._attr_unique_id = (
-            f"{device_info[CONF_DEVICEID]}_{pump}_{interval}_{sensor_type}"
-        )
-        self._attr_name = (
-            f"{device_info[CONF_DEVICE_NAME]} {pump} {interval} {sensor_type}".title()
-        )
+def fleet_sensors(fleet) -> list[FleetSensor]:
+    """The fleet wide sensors"""
+    return [
+        FleetSensor(fleet=fleet, metric=metric, interval=interval)
+        for interval in interval_names
+        for metric in (CONF_CYCLES, CONF_GALLONS)
+    ]
+
+
+class PumpspySensor(PumpspyEntity, SensorEntity):
+    """Pumpspy sensor, its value is read by its description"""
+
+    entity_description: PumpspySensorEntityDescription
 
     @property
     def native_value(self) -> StateType | date | datetime | Decimal:
-        try:
-            data = self.coordinator.data[self._motor][self._interval_converted][0]
-            data_type = "total_count" if self._type == CONF_CYCLES else self._type
-            if data["year_num"] != datetime.now().year:
-                return 0
-            elif (
-                self._interval == CONF_WEEKLY
-                and data["week_num"] == datetime.now().isocalendar().week
-            ):
-                return data[data_type]
-            elif data["month_num"] == datetime.now().month:
-                if (
-                    self._interval == CONF_DAILY
-                    and data["day_num"] == datetime.now().day
-                ):
-                    return data[data_type]
-                elif self._interval == CONF_MONTHLY:
-                    return data[data_type]
-                else:
-                    return 0
-            else:
-                return 0
-        except Exception:  # pylint: disable=broad-except
-            return 0
+        """Get value"""
+        return self.entity_description.value_fn(self.coordinator)
+
+    @property
+    def extra_state_attributes(self) -> Mapping[str, Any] | None:
+        """Attributes"""
+        if self.entity_description.attributes_fn is None:
+            return None
+        return self.entity_description.attributes_fn(self.coordinator)
 
 
-class LastCycleSensor(PumpspyEntity, SensorEntity):
-    """Daily Gallon Sensor"""
+class FleetSensor(SensorEntity):
+    """Fleet wide total over every configured device"""
 
-    def __init__(self, coordinator, pump: str):
+    _attr_should_poll = False
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+
+    def __init__(self, fleet, metric: str, interval: str):
         """Initialize the sensor."""
-        super().__init__(coordinator=coordinator)
-        self._available = True
-        self._pump = pump
-        self._attr_device_class = SensorDeviceClass.TIMESTAMP
-        self._pre_key = "" if self._pump == CONF_MAIN_PUMP else "backup_"
+        self._fleet = fleet
+        self._key = (metric, interval)
+        if metric == CONF_GALLONS:
+            self._attr_native_unit_of_measurement = UnitOfVolume.GALLONS
 
-        device_info = self.coordinator.api.get_device_info()
+        self._attr_unique_id = f"fleet_{interval_names[interval]}_{metric}"
+        self._attr_name = f"Pumpspy Fleet {interval_names[interval]} {metric}".title()
+        self._attr_device_info = DeviceInfo(
+            identifiers={(DOMAIN, "fleet")},
+            name="Pumpspy Fleet",
+            manufacturer=MANUFACTURER,
+        )
 
-        self._attr_unique_id = f"{device_info[CONF_DEVICEID]}_{pump}_last_cycle"
-        self._attr_name = f"{device_info[CONF_DEVICE_NAME]} {pump.title()} Last Cycle"
+    async def async_added_to_hass(self) -> None:
+        """Update whenever the fleet aggregates are recomputed."""
+        self.async_on_remove(self._fleet.async_add_listener(self.async_write_ha_state))
 
     @property
     def native_value(self) -> StateType | date | datetime | Decimal:
-        return dt.as_utc(
-            datetime.fromtimestamp(
-                self.coordinator.data["current"][0][f"{self._pre_key}lastcycletime"]
-                / 1000,
-                pytz.UTC,
-            )
-        )
+        return self._fleet.aggregates.get(self._key, {}).get("sum")
 
     @property
     def extra_state_attributes(self) -> Mapping[str, Any] | None:
-        return {
-            "duration": round(
-                self.coordinator.data["current"][0][f"{self._pre_key}cycleduration"]
-                / 1000,
-                1,
-            )
-        }
+        aggregate = self._fleet.aggregates.get(self._key, {})
+        return {"max": aggregate.get("max"), "top": aggregate.get("top", [])}
@@ -0,0 +1,107 @@
+"""Services of the Pumpspy-HA integration."""
+from __future__ import annotations
+
+import asyncio
+
+import aiohttp
+import voluptuous as vol
+
+from homeassistant.core import (
+    HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+)
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import config_validation as cv, device_registry
+
+from .const import (
+    ATTR_DEVICE_ID,
+    ATTR_END,
+    ATTR_INTERVAL,
+    ATTR_PUMP,
+    ATTR_START,
+    CONF_BACKUP_PUMP,
+    CONF_GALLONS,
+    CONF_MAIN_PUMP,
+    DOMAIN,
+    SERVICE_GET_CYCLE_HISTORY,
+)
+from .history import async_get_history
+from .pypumpspy import InvalidAccessToken
+
+MOTORS = {CONF_MAIN_PUMP: "ac", CONF_BACKUP_PUMP: "dc"}
+
+GET_CYCLE_HISTORY_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_DEVICE_ID): cv.string,
+        vol.Optional(ATTR_PUMP, default=CONF_MAIN_PUMP): vol.In(MOTORS),
+        vol.Optional(ATTR_INTERVAL, default="day"): vol.In(("day", "week", "month")),
+        vol.Optional(ATTR_START): cv.date,
+        vol.Optional(ATTR_END): cv.date,
+    }
+)
+
+
+def _coordinator_for_device(hass: HomeAssistant, device_id: str):
+    """Find the coordinator of a Home Assistant device"""
+    device = device_registry.async_get(hass).async_get(device_id)
+    if device is None:
+        raise HomeAssistantError(f"Unknown device {device_id}")
+    deviceids = {
+        identifier for domain, identifier in device.identifiers if domain == DOMAIN
+    }
+    for coordinator in hass.data.get(DOMAIN, {}).values():
+        if str(coordinator.api.device_id) in map(str, deviceids):
+            return coordinator
+    raise HomeAssistantError(f"Device {device_id} is not a loaded Pumpspy device")
+
+
+async def async_get_cycle_history(call: ServiceCall) -> ServiceResponse:
+    """Return the cycle and gallon buckets of a device"""
+    hass = call.hass
+    coordinator = _coordinator_for_device(hass, call.data[ATTR_DEVICE_ID])
+    pump = call.data[ATTR_PUMP]
+    if pump == CONF_BACKUP_PUMP and not coordinator.api.has_backup():
+        raise HomeAssistantError("The device has no backup pump")
+    interval = call.data[ATTR_INTERVAL]
+
+    try:
+        buckets = await async_get_history(hass).async_get(
+            coordinator,
+            MOTORS[pump],
+            interval,
+            call.data.get(ATTR_START),
+            call.data.get(ATTR_END),
+        )
+    except (
+        InvalidAccessToken,
+        aiohttp.ClientError,
+        asyncio.TimeoutError,
+        ValueError,
+    ) as err:
+        raise HomeAssistantError(f"Error fetching {interval} history: {err}") from err
+
+    return {
+        "buckets": [
+            {
+                "start": start.isoformat(),
+                "cycles": bucket.get("total_count"),
+                CONF_GALLONS: bucket.get(CONF_GALLONS),
+            }
+            for start, bucket in buckets
+        ]
+    }
+
+
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Register the services, once for all config entries"""
+    if hass.services.has_service(DOMAIN, SERVICE_GET_CYCLE_HISTORY):
+        return
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_GET_CYCLE_HISTORY,
+        async_get_cycle_history,
+        schema=GET_CYCLE_HISTORY_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
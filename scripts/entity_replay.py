@@ -0,0 +1,377 @@
+"""
+Replay fetch_data payloads through the Pumpspy entities and time their reads.
+
+Every sensor and binary sensor the platforms add for a device type is created
+against a stand-in coordinator (no running Home Assistant), then thousands of
+polls are replayed through it. Each poll reads the state and attributes of
+every entity, the way Home Assistant does when it writes their states. The
+payloads are either synthetic or recorded with the standalone poller:
+
+    python custom_components/pumpspy_ha/pypumpspy.py --username ... \
+        poll 1234 --interval day --interval week --every 60 > polls.ndjson
+    python scripts/entity_replay.py --payloads polls.ndjson
+
+The median read time of every entity is checked against --max-read-us, and
+against a previous --json report given as --baseline. The exit status is 1
+when an entity is over either limit.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+# pylint: disable=wrong-import-position
+from homeassistant.components.sensor import SensorEntity  # noqa: E402
+
+from custom_components.pumpspy_ha import binary_sensor, sensor  # noqa: E402
+from custom_components.pumpspy_ha.const import (  # noqa: E402
+    DOMAIN,
+    RHT_HUMIDITY,
+    RHT_OUTLET_STATE,
+    RHT_TEMPERATURE,
+)
+from custom_components.pumpspy_ha.pypumpspy import (  # noqa: E402
+    CAPABILITY_RHT,
+    Pumpspy,
+)
+from custom_components.pumpspy_ha.rolling import RollingStats  # noqa: E402
+
+DEVICE_TYPES = (2, 3, 4)
+INTERVALS = ("day", "week", "month")
+POLL_INTERVAL = 300
+
+ALERTS = (
+    "connected",
+    "high_water_alert",
+    "ac_power_loss",
+    "excessive_current",
+    "excessive_run_time",
+    "primary_pump_failure",
+    "battery_charge_level",
+    "backup_excessive_current",
+    "backup_excessive_run_time",
+    "backup_pump_failure",
+)
+
+
+def _bucket(day: datetime, interval: str, rng: random.Random) -> dict:
+    """Interval bucket covering day"""
+    cycles = rng.randint(0, 40)
+    return {
+        "year_num": day.year,
+        "month_num": day.month,
+        "week_num": day.isocalendar().week,
+        "day_num": day.day,
+        "total_count": cycles * {"day": 1, "week": 7, "month": 30}[interval],
+        "gallons": cycles * 9,
+    }
+
+
+def synthetic_payloads(iddevice_type: int, polls: int, seed: int) -> list[dict]:
+    """fetch_data results of a device polled every POLL_INTERVAL seconds"""
+    rng = random.Random(seed)
+    motors = ("ac", "dc") if iddevice_type == 3 else ("ac",)
+    start = time.time() - polls * POLL_INTERVAL
+    payloads = []
+    for poll in range(polls):
+        now = start + poll * POLL_INTERVAL
+        millis = int(now * 1000)
+        day = datetime.fromtimestamp(now)
+        status = {
+            "deviceid": 1000 + iddevice_type,
+            "user_nickname": "Replay",
+            "device_types_name": "Replay",
+            "last_rssi": rng.randint(-90, -40),
+            "last_rssi_time": millis,
+            "lastcycletime": millis - rng.randint(0, 3600_000),
+            "cycleduration": rng.randint(5_000, 60_000),
+        }
+        for alert in ALERTS:
+            state = rng.random() < 0.05
+            status[alert] = {"state": state, "message": "Alert" if state else ""}
+        if iddevice_type == 3:
+            status.update(
+                backup_lastcycletime=millis - rng.randint(0, 86400_000),
+                backup_cycleduration=rng.randint(5_000, 60_000),
+                battery_charge_percentage=rng.randint(80, 100),
+                battery_voltage=rng.randint(12_000, 13_500),
+                battery_estimated_life=rng.uniform(1, 8),
+                battery_tested_time=millis - 86400_000,
+                battery_updated=millis,
+            )
+        elif iddevice_type == 4:
+            status.update(
+                {
+                    RHT_TEMPERATURE: round(rng.uniform(50, 80), 1),
+                    RHT_HUMIDITY: round(rng.uniform(30, 70), 1),
+                    RHT_OUTLET_STATE: rng.random() < 0.5,
+                }
+            )
+        payloads.append(
+            {
+                "current": [status],
+                **{
+                    motor: {
+                        interval: [
+                            _bucket(day - timedelta(days=back), interval, rng)
+                            for back in range(3)
+                        ]
+                        for interval in INTERVALS
+                    }
+                    for motor in ("ac", "dc")
+                    if motor in motors
+                },
+                "stale": [],
+                "errors": {},
+            }
+        )
+    return payloads
+
+
+def recorded_payloads(path: str) -> dict[int, list[dict]]:
+    """fetch_data results per device id from a pypumpspy.py poll ndjson file"""
+    payloads: dict[int, list[dict]] = {}
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            record = json.loads(line)
+            if record.get("kind") == "poll" and record["data"]["current"]:
+                payloads.setdefault(record["deviceid"], []).append(record["data"])
+    return payloads
+
+
+class ReplayClock:
+    """Stand-in for the time module of the sensor platform, at the replayed poll"""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self.now = 0.0
+
+    def time(self) -> float:
+        """Time of the replayed poll"""
+        return self.now
+
+
+def coordinator_for(iddevice_type: int, device_id: int):
+    """
+    Stand-in for PumpspyCoordinator with the attributes the entities read,
+    around an offline Pumpspy client
+    """
+    api = Pumpspy("replay", "replay", device_id=device_id, iddevice_type=iddevice_type)
+    api.device_name = "Replay"
+    rht_stats = {}
+    if CAPABILITY_RHT in api.capabilities:
+        rht_stats = {
+            field: (RollingStats(3600, 12), RollingStats(86400, 96))
+            for field in (RHT_TEMPERATURE, RHT_HUMIDITY)
+        }
+    return SimpleNamespace(
+        api=api,
+        data=None,
+        changed=None,
+        rht_stats=rht_stats,
+        intervals=list(INTERVALS),
+    )
+
+
+def entities_for(coordinator) -> list:
+    """Every sensor and binary sensor the platforms add for the device"""
+    hass = SimpleNamespace(data={DOMAIN: {"replay": coordinator}})
+    entry = SimpleNamespace(entry_id="replay")
+    entities = []
+    for platform in (sensor, binary_sensor):
+        asyncio.run(platform.async_setup_entry(hass, entry, entities.extend))
+    return entities
+
+
+def _reader(entity):
+    """Read what Home Assistant reads when writing the entity state"""
+    if isinstance(entity, SensorEntity):
+        return lambda: (entity.native_value, entity.extra_state_attributes)
+    return lambda: (entity.is_on, entity.extra_state_attributes)
+
+
+def _apply(coordinator, payload: dict, now: float) -> None:
+    """Update the coordinator the way a poll does"""
+    sensor.time.now = now
+    coordinator.data = payload
+    coordinator.api.stats.endpoint("current").observe(0.2, 2048, False)
+    for field, windows in coordinator.rht_stats.items():
+        value = payload["current"][0].get(field)
+        if value is not None:
+            for window in windows:
+                window.add(now, value)
+
+
+def replay(coordinator, payloads: list[dict], label: str) -> list[dict]:
+    """Time and trace every entity read over the payloads"""
+    entities = entities_for(coordinator)
+    prefix = f"{coordinator.api.device_id}_"
+    readers = [_reader(entity) for entity in entities]
+    timings = [[] for _ in entities]
+    peaks = [0] * len(entities)
+    retained = [0] * len(entities)
+    now = time.time() - len(payloads) * POLL_INTERVAL
+
+    # first pass timed, second pass traced (tracemalloc slows every read)
+    for poll, payload in enumerate(payloads):
+        _apply(coordinator, payload, now + poll * POLL_INTERVAL)
+        for index, read in enumerate(readers):
+            start = time.perf_counter_ns()
+            read()
+            timings[index].append(time.perf_counter_ns() - start)
+
+    tracemalloc.start()
+    try:
+        for poll, payload in enumerate(payloads):
+            _apply(coordinator, payload, now + poll * POLL_INTERVAL)
+            for index, read in enumerate(readers):
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                result = read()
+                peak = tracemalloc.get_traced_memory()[1]
+                del result
+                current = tracemalloc.get_traced_memory()[0]
+                peaks[index] = max(peaks[index], peak - before)
+                retained[index] += current - before
+    finally:
+        tracemalloc.stop()
+
+    report = []
+    for index, entity in enumerate(entities):
+        samples = sorted(timings[index])
+        report.append(
+            {
+                "device": label,
+                "entity": entity.unique_id.removeprefix(prefix),
+                "reads": len(samples),
+                "median_us": samples[len(samples) // 2] / 1000,
+                "p95_us": samples[int(len(samples) * 0.95)] / 1000,
+                "max_us": samples[-1] / 1000,
+                "peak_bytes": peaks[index],
+                "retained_bytes_per_read": retained[index] / len(samples),
+            }
+        )
+    return report
+
+
+def check(report: list[dict], max_read_us: float, baseline, tolerance: float):
+    """Entities over the absolute limit or slower than the baseline"""
+    reference = {}
+    if baseline is not None:
+        reference = {
+            (row["device"], row["entity"]): row["median_us"]
+            for row in baseline["entities"]
+        }
+    failures = []
+    for row in report:
+        if row["median_us"] > max_read_us:
+            failures.append(f"{row['device']} {row['entity']}: over {max_read_us} us")
+        previous = reference.get((row["device"], row["entity"]))
+        # ignore sub-microsecond noise of the fastest reads
+        if previous is not None and row["median_us"] > max(
+            previous * tolerance, previous + 1
+        ):
+            failures.append(
+                f"{row['device']} {row['entity']}: {row['median_us']:.1f} us,"
+                f" baseline {previous:.1f} us"
+            )
+    return failures
+
+
+def print_table(report: list[dict]) -> None:
+    """Human readable report"""
+    print(
+        f"{'device':<10} {'entity':<36} {'median us':>10} {'p95 us':>8}"
+        f" {'max us':>8} {'peak B':>7} {'kept B':>7}"
+    )
+    for row in report:
+        print(
+            f"{row['device']:<10} {row['entity']:<36} {row['median_us']:>10.2f}"
+            f" {row['p95_us']:>8.2f} {row['max_us']:>8.1f} {row['peak_bytes']:>7}"
+            f" {row['retained_bytes_per_read']:>7.1f}"
+        )
+
+
+def main(argv=None) -> int:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(
+        description="Time the entity reads of replayed Pumpspy polls"
+    )
+    parser.add_argument(
+        "--polls", type=int, default=5000, help="synthetic polls per device type"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--payloads",
+        help="replay this pypumpspy.py poll ndjson file instead of synthetic polls",
+    )
+    parser.add_argument(
+        "--iddevice-type",
+        type=int,
+        default=3,
+        help="device type of the recorded payloads (default: 3)",
+    )
+    parser.add_argument(
+        "--max-read-us",
+        type=float,
+        default=50,
+        help="limit of the median read time of an entity",
+    )
+    parser.add_argument("--baseline", help="report of an earlier run (--json)")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.5,
+        help="allowed slowdown against the baseline (default: 1.5x)",
+    )
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args(argv)
+
+    if args.payloads:
+        runs = [
+            (coordinator_for(args.iddevice_type, device_id), payloads, str(device_id))
+            for device_id, payloads in recorded_payloads(args.payloads).items()
+        ]
+    else:
+        runs = [
+            (
+                coordinator_for(iddevice_type, 1000 + iddevice_type),
+                synthetic_payloads(iddevice_type, args.polls, args.seed),
+                f"type {iddevice_type}",
+            )
+            for iddevice_type in DEVICE_TYPES
+        ]
+
+    # the entities read the rolling statistics at the time of the poll
+    sensor.time = ReplayClock()
+    report = []
+    for coordinator, payloads, label in runs:
+        report.extend(replay(coordinator, payloads, label))
+    print_table(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({"python": sys.version, "entities": report}, file, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+    failures = check(report, args.max_read_us, baseline, args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+Time the imports of the Pumpspy integration and of the standalone client.
+
+Every measurement imports in a fresh interpreter with python -X importtime,
+so nothing is cached between runs:
+
+- integration: import custom_components.pumpspy_ha, and the modules every
+  config entry setup imports (platforms, fleet), after the modules Home
+  Assistant has already imported by then (--preload), i.e. what loading
+  the integration adds to startup
+- modules: the own time of each module of the integration in that import
+- pypumpspy: import pypumpspy.py on its own, as the standalone poller does
+
+The median of --runs imports is checked against --budget-ms and
+--pypumpspy-budget-ms. The exit status is 1 when either is over budget.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+COMPONENT = os.path.join(ROOT, "custom_components", "pumpspy_ha")
+PACKAGE = "custom_components.pumpspy_ha"
+SETUP_MODULES = tuple(
+    f"{PACKAGE}.{name}" for name in ("sensor", "binary_sensor", "fleet")
+)
+
+# loaded by Home Assistant before it sets up a config entry of an integration
+PRELOAD = (
+    "homeassistant.core",
+    "homeassistant.config_entries",
+    "homeassistant.helpers.config_validation",
+    "homeassistant.helpers.entity_platform",
+    "homeassistant.helpers.update_coordinator",
+    "homeassistant.components.http",
+    "homeassistant.components.websocket_api",
+)
+
+
+def import_times(modules, path: str, preload) -> tuple[float, dict[str, int]]:
+    """
+    Total import time in ms of the modules, and the own time in us of every
+    module newly imported with them
+    """
+    code = ";".join(
+        [f"import sys; sys.path.insert(0, {path!r})"]
+        + [f"import {name}" for name in preload]
+        + ["sys.stderr.write('-- start\\n')"]
+        + [f"import {name}" for name in modules]
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=ROOT,
+    )
+    total, times = 0, {}
+    lines = result.stderr.splitlines()
+    for line in lines[lines.index("-- start") + 1 :]:
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line.removeprefix("import time:").split("|")
+        # nested imports are indented, and included in the cumulative time
+        if not name.startswith("  "):
+            total += int(cumulative)
+        times[name.strip()] = int(own)
+    return total / 1000, times
+
+
+def measure(args) -> dict:
+    """Median import times over the runs"""
+    integration, pypumpspy, modules = [], [], {}
+    for _ in range(args.runs):
+        total, times = import_times((PACKAGE, *SETUP_MODULES), ROOT, args.preload)
+        integration.append(total)
+        for name, own in times.items():
+            if name.startswith(PACKAGE):
+                modules.setdefault(name, []).append(own / 1000)
+        total, _times = import_times(("pypumpspy",), COMPONENT, ())
+        pypumpspy.append(total)
+    return {
+        "integration_ms": statistics.median(integration),
+        "pypumpspy_ms": statistics.median(pypumpspy),
+        "modules_ms": {
+            name: statistics.median(samples)
+            for name, samples in sorted(
+                modules.items(), key=lambda item: -statistics.median(item[1])
+            )
+        },
+    }
+
+
+def main(argv=None) -> int:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(
+        description="Time the imports of the Pumpspy integration"
+    )
+    parser.add_argument("--runs", type=int, default=7, help="imports to time")
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=50,
+        help="limit of the integration import, preloaded modules excluded",
+    )
+    parser.add_argument(
+        "--pypumpspy-budget-ms",
+        type=float,
+        default=150,
+        help="limit of the standalone pypumpspy import",
+    )
+    parser.add_argument(
+        "--preload",
+        action="append",
+        help="module imported before the integration (default: what Home"
+        " Assistant has loaded by then)",
+    )
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args(argv)
+    args.preload = args.preload or list(PRELOAD)
+
+    report = measure(args)
+    print(f"integration  {report['integration_ms']:8.1f} ms")
+    print(f"pypumpspy    {report['pypumpspy_ms']:8.1f} ms")
+    for name, own in report["modules_ms"].items():
+        print(f"  {name:<44} {own:8.1f} ms own")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({"python": sys.version, **report}, file, indent=2)
+
+    failures = []
+    if report["integration_ms"] > args.budget_ms:
+        failures.append(f"integration over {args.budget_ms} ms")
+    if report["pypumpspy_ms"] > args.pypumpspy_budget_ms:
+        failures.append(f"pypumpspy over {args.pypumpspy_budget_ms} ms")
+    for failure in failures:
+        print(f"OVER BUDGET {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
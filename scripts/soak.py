@@ -0,0 +1,672 @@
+"""
+Soak test of the Pumpspy coordinator against a fake API during simulated outages.
+
+Devices of several accounts are set up the way async_setup_entry does and
+refreshed by their PumpspyCoordinator, stale section retries included,
+against a local aiohttp server that injects dropped connections, revoked
+tokens (401), slow and malformed (non json) responses, plus a full outage
+every simulated day. The coordinators run on a stand-in for Home Assistant
+(no running instance, but Home Assistant must be installed). Days of
+polling run in minutes: the event loop and the clocks of the integration run
+on virtual time, which skips ahead whenever every task is waiting for a
+timer.
+
+    python scripts/soak.py --days 3 --json soak.json
+
+Checked at the end, the exit status is 1 when one of them fails:
+- memory: growth of the traced memory after the first day
+- request rate: busiest minute against the host budget of the rate limiter
+- stuck tasks: longest poll, and tasks left once the devices are stopped
+- recovery: time from the end of an outage to the next complete poll
+- crashes: exceptions Home Assistant would log as unexpected
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from collections import Counter
+from datetime import datetime
+import json
+import logging
+import os
+import random
+import re
+import selectors
+import sys
+import time
+import tracemalloc
+import uuid
+
+import aiohttp
+from aiohttp import web
+
+ROOT = os.path.join(os.path.dirname(__file__), os.pardir)
+MANIFEST = os.path.join(ROOT, "custom_components", "pumpspy_ha", "manifest.json")
+sys.path.insert(0, ROOT)
+
+# pylint: disable=wrong-import-position
+from homeassistant.helpers.update_coordinator import UpdateFailed  # noqa: E402
+
+import custom_components.pumpspy_ha as integration  # noqa: E402
+from custom_components.pumpspy_ha import PumpspyCoordinator, pypumpspy  # noqa: E402
+from custom_components.pumpspy_ha.const import UPDATE_INTERVAL  # noqa: E402
+from custom_components.pumpspy_ha.pypumpspy import (  # noqa: E402
+    HOST_BURST,
+    HOST_RATE,
+    POLL_BUDGET,
+    InvalidResponse,
+    Pumpspy,
+    PumpspyAccount,
+    RateLimiter,
+)
+
+DAY = 86400
+# ConfigEntryNotReady retry delay of Home Assistant, roughly
+SETUP_RETRY = 60
+TOKEN_TTL = 6 * 3600
+MEMORY_SAMPLE_INTERVAL = 3600
+# real seconds the loop waits for socket events before skipping ahead, and
+# virtual seconds every loop iteration takes (timers due in less than the
+# clock resolution would otherwise never see the clock move)
+IO_GRACE = 0.0005
+LOOP_TICK = 1e-6
+
+# errors async_setup_entry (and the config flow) turn into a retry, and the
+# errors of an update DataUpdateCoordinator logs as a plain failed update
+SETUP_ERRORS = (InvalidResponse, aiohttp.ClientError, asyncio.TimeoutError)
+UPDATE_ERRORS = (UpdateFailed, aiohttp.ClientError, asyncio.TimeoutError)
+
+DEVICE_TYPES = (2, 3, 4)
+
+
+class VirtualClock:
+    """
+    Clock only moved by the event loop skipping ahead, so a run doesn't
+    depend on how fast the machine is
+    """
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self._time = time.time()
+        self._monotonic = time.monotonic()
+        self.offset = 0.0
+
+    def time(self) -> float:
+        """Virtual wall clock"""
+        return self._time + self.offset
+
+    def monotonic(self) -> float:
+        """Virtual monotonic clock"""
+        return self._monotonic + self.offset
+
+
+class VirtualSelector:
+    """
+    Selector skipping the clock ahead instead of sleeping: when no socket is
+    ready within IO_GRACE, the timeout the loop asked for (the delay of its
+    next timer) is added to the clock.
+    """
+
+    def __init__(self, clock: VirtualClock) -> None:
+        """Initialize."""
+        self._clock = clock
+        self._selector = selectors.DefaultSelector()
+
+    def select(self, timeout=None):
+        """Wait for socket events, in virtual time"""
+        self._clock.offset += LOOP_TICK
+        events = self._selector.select(0)
+        if events or timeout == 0:
+            return events
+        events = self._selector.select(IO_GRACE)
+        if not events and timeout is not None:
+            self._clock.offset += timeout
+        return events
+
+    def __getattr__(self, name):
+        return getattr(self._selector, name)
+
+
+class VirtualEventLoop(asyncio.SelectorEventLoop):
+    """Event loop running on a VirtualClock"""
+
+    def __init__(self, clock: VirtualClock) -> None:
+        """Initialize."""
+        self._clock = clock
+        super().__init__(VirtualSelector(clock))
+
+    def time(self) -> float:
+        return self._clock.monotonic()
+
+
+async def _wait(stop: asyncio.Event, delay: float) -> None:
+    """Sleep for delay seconds, or until stopped"""
+    try:
+        await asyncio.wait_for(stop.wait(), delay)
+    except asyncio.TimeoutError:
+        pass
+
+
+class SoakHass:
+    """
+    Stand-in for HomeAssistant with what DataUpdateCoordinator and
+    async_call_later use. Jobs run as tasks of the loop, and the exceptions
+    escaping them (Home Assistant logs those) are counted as crashes.
+    """
+
+    is_stopping = False
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, results) -> None:
+        """Initialize."""
+        self.loop = loop
+        self.data: dict = {}
+        self.tasks: set[asyncio.Task] = set()
+        self._results = results
+
+    def async_run_hass_job(self, job, *args, **kwargs):
+        """Run a job, as a task when it is a coroutine function"""
+        result = job.target(*args)
+        if asyncio.iscoroutine(result):
+            return self.async_create_task(result, job.name)
+        return result
+
+    def async_create_task(self, target, name=None, eager_start=False):
+        """Run a coroutine as a tracked task"""
+        task = self.loop.create_task(target, name=name)
+        self.tasks.add(task)
+        task.add_done_callback(self._done)
+        return task
+
+    def _done(self, task: asyncio.Task) -> None:
+        """Forget a finished task, counting its exception"""
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self._results["crashes"].append(f"{task.get_name()}: {task.exception()!r}")
+
+
+class FakeApi:
+    """
+    Pumpspy API serving synthetic devices. Every request draws a fault from
+    a generator seeded with the seed, the path and the number of earlier
+    requests to the path, so the faults don't depend on the order in which
+    concurrent requests arrive. Every request made during an outage has its
+    connection dropped.
+    """
+
+    def __init__(self, clock: VirtualClock, args, start: float) -> None:
+        """Initialize."""
+        self.clock = clock
+        self.seed = args.seed
+        self.faults = (
+            ("disconnect", args.disconnect_rate),
+            ("unauthorized", args.unauthorized_rate),
+            ("slow", args.slow_rate),
+            ("malformed", args.malformed_rate),
+        )
+        self.outages = [
+            (start + day * DAY + DAY / 4, start + day * DAY + DAY / 4 + args.outage)
+            for day in range(args.days)
+            if args.outage
+        ]
+        self.tokens: dict[str, float] = {}
+        self.devices: dict[str, int] = {}
+        self.counts: Counter = Counter()
+        self.paths: Counter = Counter()
+        self._minute = None
+        self._minute_count = 0
+        self.peak_per_minute = 0
+        # set when shutting down, ends slow answers of abandoned requests
+        self.closed = asyncio.Event()
+
+    def in_outage(self, now: float) -> bool:
+        """Whether the server is down"""
+        return any(start <= now < end for start, end in self.outages)
+
+    def _count(self, now: float) -> None:
+        """Track the busiest minute"""
+        minute = int(now // 60)
+        if minute != self._minute:
+            self._minute = minute
+            self._minute_count = 0
+        self._minute_count += 1
+        self.peak_per_minute = max(self.peak_per_minute, self._minute_count)
+
+    def _fault(self, rng: random.Random) -> str | None:
+        """Fault to inject, None to answer normally"""
+        draw = rng.random()
+        for fault, rate in self.faults:
+            if draw < rate:
+                return fault
+            draw -= rate
+        return None
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        """Answer any request"""
+        now = self.clock.time()
+        self._count(now)
+        self.counts["requests"] += 1
+        self.paths[request.path] += 1
+        rng = random.Random(f"{self.seed}:{request.path}:{self.paths[request.path]}")
+        fault = "outage" if self.in_outage(now) else self._fault(rng)
+        if fault is not None:
+            self.counts[fault] += 1
+        if fault in ("outage", "disconnect"):
+            request.transport.close()
+            return web.Response()
+        if fault == "slow":
+            await _wait(self.closed, rng.uniform(5, 2 * POLL_BUDGET))
+            now = self.clock.time()
+
+        if request.path == pypumpspy.TOKEN_URL:
+            token = uuid.uuid4().hex
+            self.tokens[token] = now + TOKEN_TTL
+            # expired tokens are forgotten, the server can't grow either
+            for expired in [t for t, end in self.tokens.items() if end < now]:
+                del self.tokens[expired]
+            return web.json_response({"access_token": token})
+
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if fault == "unauthorized":
+            self.tokens.pop(token, None)
+        if self.tokens.get(token, 0) < now:
+            return web.json_response({"error": "invalid_token"}, status=401)
+        if fault == "malformed":
+            return web.Response(text='[{"truncated', content_type="application/json")
+        return web.json_response(self._body(request.path, now, rng))
+
+    def _body(self, path: str, now: float, rng: random.Random):
+        """Json body of an endpoint"""
+        if path.startswith(pypumpspy.UID_URL):
+            return [{"uid": 1}]
+        if path.startswith(pypumpspy.LOCATIONS_URL):
+            return [{"lid": 1, "nickname": "Soak"}]
+        if path.startswith(pypumpspy.DEVICES_URL):
+            return [
+                {"deviceid": int(deviceid), "iddevice_types": iddevice_type}
+                for deviceid, iddevice_type in self.devices.items()
+            ]
+        if match := re.fullmatch(r"/devices/deviceid/(\d+)", path):
+            iddevice_type = self.devices[match[1]]
+            return [{"iddevice_types": iddevice_type, "device_types_name": "Soak"}]
+        if match := re.fullmatch(r"/\w+_cycles/deviceid/\d+.*/interval/(\w+)", path):
+            day = datetime.fromtimestamp(now)
+            return [
+                {
+                    "year_num": day.year,
+                    "month_num": day.month,
+                    "week_num": day.isocalendar().week,
+                    "day_num": day.day,
+                    "total_count": rng.randint(0, 40),
+                    "gallons": rng.randint(0, 400),
+                }
+            ]
+        millis = int(now * 1000)
+        return [
+            {
+                "last_rssi": rng.randint(-90, -40),
+                "last_rssi_time": millis,
+                "lastcycletime": millis,
+                "cycleduration": 20000,
+                "connected": {"state": True, "message": ""},
+            }
+        ]
+
+
+async def discover(client: Pumpspy, results, stop: asyncio.Event) -> None:
+    """Look up the locations and devices, the way the config flow does"""
+    while not stop.is_set():
+        results["discovery_attempts"] += 1
+        try:
+            await client.setup()
+            locations = await client.get_locations()
+            if locations:
+                client.set_location(locations[0]["lid"])
+                if await client.get_devices():
+                    results["discovered"] += 1
+                    return
+        except SETUP_ERRORS:
+            pass
+        except Exception as err:  # pylint: disable=broad-except
+            results["crashes"].append(f"discovery: {err!r}")
+        await asyncio.sleep(SETUP_RETRY)
+
+
+class Device:
+    """A config entry: set up like async_setup_entry, then refreshed"""
+
+    def __init__(self, hass: SoakHass, client: Pumpspy, args, results) -> None:
+        """Initialize."""
+        self.hass = hass
+        self.client = client
+        self.args = args
+        self.results = results
+        self.coordinator: PumpspyCoordinator | None = None
+        # index of the first outage this device hasn't recovered from yet
+        self.recovering = 0
+
+    async def run(self, api: FakeApi, stop: asyncio.Event) -> None:
+        """Set up, then refresh on the update interval until stopped"""
+        self.api = api
+        while not stop.is_set():
+            if await self._async_setup():
+                break
+            await _wait(stop, SETUP_RETRY)
+        while not stop.is_set():
+            await _wait(stop, self.coordinator.update_interval.total_seconds())
+            if not stop.is_set():
+                await self._async_refresh()
+        if self.coordinator is not None:
+            self.coordinator.async_cancel_retry()
+
+    async def _async_setup(self) -> bool:
+        """Set up the client and refresh once, False to retry later"""
+        self.results["setup_attempts"] += 1
+        try:
+            await self.client.setup()
+        except SETUP_ERRORS:
+            return False
+        except Exception as err:  # pylint: disable=broad-except
+            self.results["crashes"].append(f"setup: {err!r}")
+            return False
+
+        self.coordinator = PumpspyCoordinator(
+            hass=self.hass,
+            api=self.client,
+            weekly=self.args.weekly,
+            monthly=self.args.monthly,
+        )
+        # recovery is checked on every update, stale section retries included
+        update_listeners = self.coordinator.async_update_listeners
+
+        def _async_update_listeners() -> None:
+            update_listeners()
+            self._record_recovery()
+
+        self.coordinator.async_update_listeners = _async_update_listeners
+        await self._async_refresh()
+        if self.coordinator.last_update_success:
+            return True
+        # async_config_entry_first_refresh raises ConfigEntryNotReady
+        self.coordinator.async_cancel_retry()
+        self.coordinator = None
+        return False
+
+    async def _async_refresh(self) -> None:
+        """Refresh the coordinator, recording the outcome"""
+        coordinator = self.coordinator
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        coordinator.last_exception = None
+        await coordinator.async_refresh()
+        self.results["polls"] += 1
+        self.results["max_poll"] = max(self.results["max_poll"], loop.time() - start)
+        if not coordinator.last_update_success:
+            self.results["failed_polls"] += 1
+            if not isinstance(coordinator.last_exception, UPDATE_ERRORS):
+                self.results["crashes"].append(
+                    f"update: {coordinator.last_exception!r}"
+                )
+        elif coordinator.data["stale"]:
+            self.results["stale_polls"] += 1
+
+    def _record_recovery(self) -> None:
+        """Time to the first complete update after each outage"""
+        data = self.coordinator.data
+        if not data or data["stale"]:
+            return
+        now = self.api.clock.time()
+        outages = self.api.outages
+        while self.recovering < len(outages) and outages[self.recovering][1] <= now:
+            self.results["recoveries"].append(now - outages[self.recovering][1])
+            self.recovering += 1
+
+
+async def sample_memory(samples: list, clock: VirtualClock, stop) -> None:
+    """Traced memory every simulated hour"""
+    while not stop.is_set():
+        samples.append((clock.time(), tracemalloc.get_traced_memory()[0]))
+        try:
+            await asyncio.wait_for(stop.wait(), MEMORY_SAMPLE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def soak(args, clock: VirtualClock) -> dict:
+    """Run the devices against the fake api, return the raw results"""
+    start = clock.time()
+    api = FakeApi(clock, args, start)
+    app = web.Application()
+    app.router.add_route("*", "/{path:.*}", api.handle)
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    base_url = "http://{}:{}".format(*runner.addresses[0])
+
+    results = {
+        "discovered": 0,
+        "discovery_attempts": 0,
+        "setup_attempts": 0,
+        "polls": 0,
+        "failed_polls": 0,
+        "stale_polls": 0,
+        "max_poll": 0.0,
+        "recoveries": [],
+        "crashes": [],
+    }
+    hass = SoakHass(asyncio.get_running_loop(), results)
+    rate_limiter = RateLimiter()
+    accounts = [
+        PumpspyAccount(f"soak{index}@example.com", "password", base_url, pool_size=4)
+        for index in range(args.accounts)
+    ]
+    devices = []
+    for index in range(args.devices):
+        device_id = 1000 + index
+        api.devices[str(device_id)] = DEVICE_TYPES[index % len(DEVICE_TYPES)]
+        client = Pumpspy(
+            None,
+            None,
+            device_id=device_id,
+            rate_limiter=rate_limiter,
+            account=accounts[index % args.accounts],
+        )
+        devices.append(Device(hass, client, args, results))
+
+    stop = asyncio.Event()
+    samples: list[tuple[float, int]] = []
+    tasks = [
+        asyncio.create_task(
+            discover(
+                Pumpspy(None, None, rate_limiter=rate_limiter, account=account),
+                results,
+                stop,
+            ),
+            name=f"discovery {index}",
+        )
+        for index, account in enumerate(accounts)
+    ] + [
+        asyncio.create_task(device.run(api, stop), name=f"device {index}")
+        for index, device in enumerate(devices)
+    ]
+    sampler = asyncio.create_task(sample_memory(samples, clock, stop))
+    await asyncio.sleep(args.days * DAY)
+
+    stop.set()
+    # a device in the middle of a poll gets the whole budget to finish it
+    done, pending = await asyncio.wait(
+        [*tasks, sampler, *hass.tasks], timeout=2 * POLL_BUDGET
+    )
+    for task in done.intersection(tasks):
+        if task.exception() is not None:
+            results["crashes"].append(f"{task.get_name()}: {task.exception()!r}")
+    for account in accounts:
+        await account.close()
+    api.closed.set()
+    # let the server send the answers that were held back
+    await asyncio.sleep(1)
+    await runner.cleanup()
+    await asyncio.sleep(0)
+    leftover = [
+        task.get_name()
+        for task in asyncio.all_tasks()
+        if task is not asyncio.current_task()
+    ]
+    for task in pending:
+        task.cancel()
+
+    return {
+        "api": api,
+        "results": results,
+        "memory": samples,
+        "stuck_tasks": sorted({task.get_name() for task in pending} | set(leftover)),
+        "start": start,
+    }
+
+
+def summarize(args, raw: dict, elapsed: float) -> dict:
+    """Report and failed checks of a run"""
+    api: FakeApi = raw["api"]
+    results = raw["results"]
+    recoveries = sorted(results["recoveries"])
+    samples = raw["memory"]
+    warm = [size for when, size in samples if when >= raw["start"] + DAY]
+    baseline = warm[0] if warm else (samples[-1][1] if samples else 0)
+    growth = (max(warm) - baseline) if warm else 0
+    rate_budget = HOST_RATE * 60 + HOST_BURST
+    with open(MANIFEST, encoding="utf-8") as file:
+        version = json.load(file)["version"]
+
+    failures = []
+    if growth > args.max_memory_growth * 1024:
+        failures.append(f"memory grew {growth / 1024:.0f} KiB after the first day")
+    if api.peak_per_minute > rate_budget:
+        failures.append(
+            f"{api.peak_per_minute} requests in a minute, budget {rate_budget:.0f}"
+        )
+    if results["max_poll"] > args.max_poll:
+        failures.append(f"a poll took {results['max_poll']:.0f}s")
+    if raw["stuck_tasks"]:
+        failures.append(f"tasks left running: {raw['stuck_tasks']}")
+    expected = len(api.outages) * args.devices
+    if len(recoveries) < expected:
+        failures.append(
+            f"{expected - len(recoveries)} of {expected} outages not recovered from"
+        )
+    if recoveries and recoveries[-1] > args.max_recovery:
+        failures.append(f"recovering took {recoveries[-1]:.0f}s")
+    if results["discovered"] < args.accounts:
+        failures.append(
+            f"{args.accounts - results['discovered']} accounts never discovered"
+        )
+    if results["crashes"]:
+        failures.append(f"{len(results['crashes'])} unexpected exceptions")
+
+    return {
+        "version": version,
+        "parameters": {
+            key: value for key, value in vars(args).items() if key != "json"
+        },
+        "real_seconds": round(elapsed, 1),
+        "requests": dict(api.counts),
+        "peak_requests_per_minute": api.peak_per_minute,
+        "request_budget_per_minute": rate_budget,
+        "requests_per_poll": round(
+            api.counts["requests"] / max(results["polls"], 1), 2
+        ),
+        "discovery_attempts": results["discovery_attempts"],
+        "setup_attempts": results["setup_attempts"],
+        "polls": results["polls"],
+        "failed_polls": results["failed_polls"],
+        "stale_polls": results["stale_polls"],
+        "max_poll_seconds": round(results["max_poll"], 1),
+        "recovery_seconds": {
+            "count": len(recoveries),
+            "median": round(recoveries[len(recoveries) // 2]) if recoveries else None,
+            "max": round(recoveries[-1]) if recoveries else None,
+        },
+        "memory_kib": {
+            "first_day": round(baseline / 1024),
+            "peak_after_first_day": round(max(warm) / 1024) if warm else None,
+            "growth": round(growth / 1024),
+        },
+        "stuck_tasks": raw["stuck_tasks"],
+        "crashes": results["crashes"][:20],
+        "failures": failures,
+    }
+
+
+def main(argv=None) -> int:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(
+        description="Soak test the Pumpspy coordinator against a faulty fake API"
+    )
+    parser.add_argument("--days", type=int, default=3, help="simulated days")
+    parser.add_argument("--devices", type=int, default=30)
+    parser.add_argument("--accounts", type=int, default=5)
+    parser.add_argument("--weekly", action="store_true", help="poll weekly totals")
+    parser.add_argument("--monthly", action="store_true", help="poll monthly totals")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--disconnect-rate", type=float, default=0.02)
+    parser.add_argument("--unauthorized-rate", type=float, default=0.01)
+    parser.add_argument("--slow-rate", type=float, default=0.02)
+    parser.add_argument("--malformed-rate", type=float, default=0.02)
+    parser.add_argument(
+        "--outage", type=float, default=3600, help="seconds of outage every day"
+    )
+    parser.add_argument(
+        "--max-memory-growth",
+        type=float,
+        default=1024,
+        help="KiB the traced memory may grow after the first day",
+    )
+    parser.add_argument(
+        "--max-poll",
+        type=float,
+        default=POLL_BUDGET + 1,
+        help="seconds a poll, token refresh included, may take",
+    )
+    parser.add_argument(
+        "--max-recovery",
+        type=float,
+        default=3 * UPDATE_INTERVAL,
+        help="seconds from the end of an outage to the next complete poll",
+    )
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+    if not args.verbose:
+        # the injected faults are logged by the client and the server
+        for logger in (
+            pypumpspy.LOG,
+            integration._LOGGER,  # pylint: disable=protected-access
+            logging.getLogger("aiohttp"),
+        ):
+            logger.setLevel(logging.CRITICAL)
+
+    random.seed(args.seed)
+    # the update interval jitter of the coordinators
+    random.seed(args.seed)
+    clock = VirtualClock()
+    pypumpspy.time = integration.time = clock
+    loop = VirtualEventLoop(clock)
+    asyncio.set_event_loop(loop)
+    tracemalloc.start()
+    started = time.monotonic()
+    try:
+        raw = loop.run_until_complete(soak(args, clock))
+    finally:
+        tracemalloc.stop()
+        loop.close()
+    report = summarize(args, raw, time.monotonic() - started)
+
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    return 1 if report["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())